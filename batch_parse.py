@@ -0,0 +1,126 @@
+"""Parse caption archives (JSONL) in bulk, in a process pool."""
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from caption_parser import PARSER_VERSION, split_sections_strict
+
+
+class BatchStats:
+    """Counts over one batch run. `no_ingredients` / `no_instructions` are
+    captions where the parser found none of that section; `no_recipe`
+    those where it found neither, which is where parser gaps show up."""
+
+    FIELDS = ("records", "errors", "no_ingredients", "no_instructions", "no_recipe")
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+
+    def add(self, counts):
+        for name, n in zip(self.FIELDS, counts):
+            setattr(self, name, getattr(self, name) + n)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def summary(self):
+        def share(n):
+            return f"{n} ({n / self.records:.1%})" if self.records else "0"
+        return (f"{self.records} captions, {self.errors} unreadable | no ingredients {share(self.no_ingredients)}, "
+                f"no instructions {share(self.no_instructions)}, neither {share(self.no_recipe)}")
+
+
+def missing_sections(sections):
+    """Which of "ingredients" / "instructions" the parser found nothing for."""
+    missing = []
+    if not any((sections.get("ingredients") or {}).values()):
+        missing.append("ingredients")
+    if not sections.get("instructions"):
+        missing.append("instructions")
+    return missing
+
+
+def _parse_chunk(job):
+    """Worker: parse one chunk of (line number, JSON text) pairs and return
+    the output JSONL for it plus its counts; must stay top-level so it
+    pickles. Decoding and encoding happen here too, so the parent process
+    only moves text around."""
+    lines, field = job
+    out = []
+    records = errors = no_ingredients = no_instructions = no_recipe = 0
+    for lineno, line in lines:
+        try:
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {field: record}
+            caption = record.get(field)
+            if caption is not None and not isinstance(caption, str):
+                raise ValueError(f"{field!r} is not a string")
+            sections = split_sections_strict(caption or "")
+        except Exception as e:
+            errors += 1
+            out.append(json.dumps({"line": lineno, "error": str(e)}, ensure_ascii=False))
+            continue
+        records += 1
+        record["sections"] = sections
+        record["parser_version"] = PARSER_VERSION
+        missing = missing_sections(sections)
+        if missing:
+            record["missing"] = missing
+            no_ingredients += "ingredients" in missing
+            no_instructions += "instructions" in missing
+            no_recipe += len(missing) == 2
+        out.append(json.dumps(record, ensure_ascii=False))
+    text = "\n".join(out) + "\n" if out else ""
+    return text, (records, errors, no_ingredients, no_instructions, no_recipe)
+
+
+def _chunks(lines, size, field):
+    numbered = ((n, line) for n, line in enumerate(lines, 1) if line.strip())
+    while True:
+        chunk = list(islice(numbered, size))
+        if not chunk:
+            return
+        yield chunk, field
+
+
+def parse_jsonl(lines, out, workers=None, chunk_size=500, field="caption", window=None):
+    """Parse every caption in `lines` (JSONL: objects with a `field` key,
+    or bare JSON strings) and write one JSONL record per input line to `out`.
+
+    Output records are the input object plus `sections`, `parser_version`
+    and, when the parser found no ingredients and/or instructions, a
+    `missing` list naming them. Lines that aren't valid JSON come out as
+    {"line": n, "error": ...}. Blank lines are skipped.
+
+    Work goes to `workers` processes in chunks of `chunk_size` lines, with
+    at most `window` (default 2 x workers) chunks outstanding, and results
+    are written in input order as soon as the oldest chunk is done. Memory
+    therefore stays at a few chunks however large the input is. Returns
+    BatchStats.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = BatchStats()
+    jobs = _chunks(lines, max(1, chunk_size), field)
+    if workers <= 1:
+        for text, counts in map(_parse_chunk, jobs):
+            out.write(text)
+            stats.add(counts)
+        return stats
+    window = window or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for job in jobs:
+            if len(pending) >= window:
+                text, counts = pending.popleft().result()
+                out.write(text)
+                stats.add(counts)
+            pending.append(pool.submit(_parse_chunk, job))
+        while pending:
+            text, counts = pending.popleft().result()
+            out.write(text)
+            stats.add(counts)
+    return stats
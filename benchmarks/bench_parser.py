@@ -0,0 +1,177 @@
+"""Caption parser benchmark.
+
+Runs the caption parsing functions over the recorded corpus in
+captions.jsonl and reports throughput (captions/sec) and p50/p99 latency
+per function. Results are compared against baseline.json; a function that
+got slower than the allowed tolerance makes the run exit non-zero.
+
+    python benchmarks/bench_parser.py                  # compare to baseline
+    python benchmarks/bench_parser.py --save-baseline  # record new baseline
+    python benchmarks/bench_parser.py --corpus dump.jsonl --rounds 50
+
+Baselines are machine specific; re-record after moving to a new box, and
+in the same commit as any change to the corpus (a baseline recorded on a
+different corpus is refused rather than compared against).
+"""
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from caption_parser import (  # noqa: E402
+    extract_servings_and_macros,
+    parse_numbered_steps,
+    split_ingredients_and_instructions,
+    split_instructions_by_actions,
+    split_sections_strict,
+)
+
+DEFAULT_CORPUS = os.path.join(HERE, "captions.jsonl")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+
+
+def load_corpus(path):
+    captions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                captions.append(json.loads(line)["caption"])
+    return captions
+
+
+def corpus_digest(captions):
+    """Identifies the corpus a baseline was recorded on."""
+    return hashlib.sha256("\n".join(captions).encode("utf-8")).hexdigest()[:16]
+
+
+def build_inputs(captions):
+    """Inputs per benchmarked function, each derived from the same corpus."""
+    instr_blocks = [split_ingredients_and_instructions(c)[1] for c in captions]
+    return {
+        "split_sections_strict": captions,
+        "extract_servings_and_macros": captions,
+        "parse_numbered_steps": instr_blocks,
+        "split_instructions_by_actions": instr_blocks,
+    }
+
+
+FUNCTIONS = {
+    "split_sections_strict": split_sections_strict,
+    "extract_servings_and_macros": extract_servings_and_macros,
+    "parse_numbered_steps": parse_numbered_steps,
+    "split_instructions_by_actions": split_instructions_by_actions,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def bench_function(fn, inputs, rounds, warmup=2):
+    for _ in range(warmup):
+        for item in inputs:
+            fn(item)
+    samples = []
+    round_rates = []
+    clock = time.perf_counter_ns
+    for _ in range(rounds):
+        started = clock()
+        for item in inputs:
+            t0 = clock()
+            fn(item)
+            samples.append(clock() - t0)
+        elapsed = clock() - started
+        if elapsed:
+            round_rates.append(len(inputs) * 1e9 / elapsed)
+    samples.sort()
+    # median round, so one noisy round (GC, scheduler) doesn't skew the rate
+    return {
+        "calls": len(samples),
+        "captions_per_sec": statistics.median(round_rates) if round_rates else 0.0,
+        "p50_us": percentile(samples, 50) / 1000.0,
+        "p99_us": percentile(samples, 99) / 1000.0,
+        "mean_us": statistics.fmean(samples) / 1000.0,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return names of functions whose throughput regressed past `tolerance`."""
+    regressed = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = res["captions_per_sec"] / base["captions_per_sec"] if base["captions_per_sec"] else 1.0
+        res["vs_baseline"] = ratio
+        if ratio < 1.0 - tolerance:
+            regressed.append(name)
+    return regressed
+
+
+def main(argv=None):
+    p = ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--corpus", default=DEFAULT_CORPUS)
+    p.add_argument("--baseline", default=DEFAULT_BASELINE)
+    p.add_argument("--rounds", type=int, default=30)
+    p.add_argument("--tolerance", type=float, default=0.25,
+                   help="allowed throughput drop vs baseline (0.25 = 25%%)")
+    p.add_argument("--only", action="append", choices=sorted(FUNCTIONS),
+                   help="benchmark just this function (repeatable)")
+    p.add_argument("--save-baseline", action="store_true")
+    p.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = p.parse_args(argv)
+
+    captions = load_corpus(args.corpus)
+    inputs = build_inputs(captions)
+    names = args.only or list(FUNCTIONS)
+    results = {name: bench_function(FUNCTIONS[name], inputs[name], args.rounds) for name in names}
+
+    digest = corpus_digest(captions)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            recorded = json.load(f)
+        if recorded.get("digest") != digest:
+            print(f"Baseline {args.baseline} was recorded on a different corpus "
+                  f"({recorded.get('captions', '?')} captions, now {len(captions)}); "
+                  f"re-record it with --save-baseline")
+            return 1
+        baseline = recorded.get("results", {})
+    regressed = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        print(json.dumps({"corpus": len(captions), "rounds": args.rounds, "results": results}, indent=2))
+    else:
+        print(f"{len(captions)} captions x {args.rounds} rounds")
+        print(f"{'function':32} {'captions/s':>12} {'p50 us':>9} {'p99 us':>9} {'vs base':>8}")
+        for name, res in results.items():
+            vs = f"{res['vs_baseline']:.2f}x" if "vs_baseline" in res else "-"
+            flag = "  ⚠️ slower" if name in regressed else ""
+            print(f"{name:32} {res['captions_per_sec']:12.0f} {res['p50_us']:9.1f} {res['p99_us']:9.1f} {vs:>8}{flag}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"corpus": os.path.basename(args.corpus), "captions": len(captions),
+                       "digest": digest, "rounds": args.rounds, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if regressed:
+        print(f"Regression beyond {args.tolerance:.0%}: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""CLI startup benchmark.
+
+Runs subcommands of the cookbook script in fresh interpreters and reports
+the median wall time per command. Commands that never render or talk to
+Instagram must stay under the startup budget and must not import any of
+the heavy libraries (ReportLab's layout engine, PIL, instaloader,
+requests, qrcode, numpy); either failure makes the run exit non-zero.
+`diagnose` measures text and images, so it may import ReportLab and PIL
+but nothing else heavy, and has its own, looser `--measure-budget`.
+The CI workflow runs this script on every push.
+
+    python benchmarks/bench_startup.py                 # check the budget
+    python benchmarks/bench_startup.py --budget 0.25 --rounds 10
+
+The budget includes interpreter startup (`python -c pass` is printed for
+reference), so it is machine specific. The commands run against an empty
+library made up front; one that adds or changes files beside it also
+fails the run.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SCRIPT = os.path.join(ROOT, "instragram-to-cookbook-convert.py")
+
+HEAVY = ("reportlab.platypus", "reportlab.pdfgen", "PIL", "instaloader", "requests", "qrcode", "numpy")
+
+
+# what the measuring commands need; anything else heavy still fails them
+MEASURE_IMPORTS = ("reportlab.platypus", "reportlab.pdfgen", "PIL")
+
+
+def commands(library):
+    """(label, argv, measures) for each checked command; `measures` ones
+    may import MEASURE_IMPORTS and get the measure budget."""
+    return [
+        ("--help", ["--help"], False),
+        ("run --help", ["run", "--help"], False),
+        ("fetch --help", ["fetch", "--help"], False),
+        ("render --help", ["render", "--help"], False),
+        ("parse", ["parse", "--library", library], False),
+        ("parse --all", ["parse", "--all", "--library", library], False),
+        ("diagnose", ["diagnose", "--library", library], True),
+    ]
+
+
+def empty_library(path):
+    sys.path.insert(0, ROOT)
+    from recipe_store import RecipeLibrary
+
+    RecipeLibrary(path).close()
+
+
+def snapshot(directory):
+    """(name, size, mtime) of everything under `directory`."""
+    found = set()
+    for parent, _dirs, files in os.walk(directory):
+        for name in files:
+            st = os.stat(os.path.join(parent, name))
+            found.add((os.path.relpath(os.path.join(parent, name), directory), st.st_size, st.st_mtime_ns))
+    return found
+
+
+def wall_time(argv, rounds):
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable] + argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def heavy_imports(argv):
+    """Heavy top-level packages imported by `argv`, from -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime"] + argv, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE, text=True, check=True).stderr
+    found = set()
+    for line in out.splitlines():
+        module = line.rsplit("|", 1)[-1].strip()
+        for name in HEAVY:
+            if module == name or module.startswith(name + "."):
+                found.add(name)
+    return sorted(found)
+
+
+def main(argv=None):
+    p = ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--budget", type=float, default=0.3, help="seconds allowed per command (median)")
+    p.add_argument("--measure-budget", type=float, default=1.0,
+                   help="seconds allowed for diagnose, which loads ReportLab and PIL")
+    p.add_argument("--rounds", type=int, default=5)
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as tmp:
+        library = os.path.join(tmp, "recipes.sqlite")
+        empty_library(library)
+        before = snapshot(tmp)
+        base = wall_time(["-c", "pass"], args.rounds)
+        print(f"{'command':16} {'median s':>9}  heavy imports")
+        print(f"{'(python -c pass)':16} {base:9.3f}")
+        failed = []
+        for label, cmd, measures in commands(library):
+            seconds = wall_time([SCRIPT] + cmd, args.rounds)
+            heavy = heavy_imports([SCRIPT] + cmd)
+            budget = args.measure_budget if measures else args.budget
+            forbidden = [name for name in heavy if not (measures and name in MEASURE_IMPORTS)]
+            flag = ""
+            if seconds > budget or forbidden:
+                failed.append(label)
+                flag = "  ⚠️ over budget" if seconds > budget else "  ⚠️ heavy imports"
+            print(f"{label:16} {seconds:9.3f}  {', '.join(heavy) or '-'}{flag}")
+        touched = sorted({name for name, _size, _mtime in snapshot(tmp) ^ before})
+        if touched:
+            failed.append("files")
+            print(f"⚠️ files created or changed beside the library: {', '.join(touched)}")
+
+    if failed:
+        print(f"Startup budget exceeded or heavy imports in: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,478 @@
+"""Caption parsing: turn a raw Instagram caption into recipe sections.
+
+Every pattern is compiled once at import. A caption is tokenized in a
+single pass (tokenize_caption) that records where header, bullet,
+numbered-step, macro, servings, notes and action-verb lines start; the
+section splitter then only runs its exact patterns from those offsets
+instead of rescanning the whole caption for each kind of line.
+"""
+import re
+from bisect import bisect_left
+
+# Bump whenever split_sections_strict() output changes, so parsed sections
+# stored in the recipe library are parsed again instead of reused.
+PARSER_VERSION = 2
+
+# ---- titles and typography ----
+_INSTAGRAM_PREFIX = re.compile(r"^[^:]+ on Instagram:\s*")
+_HALF = re.compile(r"\b1/2\b")
+_QUARTER = re.compile(r"\b1/4\b")
+_THREE_QUARTERS = re.compile(r"\b3/4\b")
+_NUMBER_RANGE = re.compile(r"(\d)\s*-\s*(\d)")
+_WHITESPACE = re.compile(r"\s+")
+
+def clean_title(title, max_length=60):
+    clean = _INSTAGRAM_PREFIX.sub("", title or "")
+    clean = clean.strip("\"'“”")
+    if len(clean) <= max_length:
+        return clean if clean else "Untitled Recipe"
+    i = clean.rfind(" ", 0, max_length)
+    first_line = clean[:i] + "…" if i > 0 else clean[:max_length] + "…"
+    return first_line
+
+def parse_typography(s):
+    s = s or ""
+    if "/" in s:
+        s = _HALF.sub("½", s)
+        s = _QUARTER.sub("¼", s)
+        s = _THREE_QUARTERS.sub("¾", s)
+    if "-" in s:
+        s = _NUMBER_RANGE.sub(r"\1–\2", s)
+    s = _WHITESPACE.sub(" ", s)
+    return s.strip(" .")
+
+# ---- macros / servings ----
+MACRO_PATTERN = re.compile(
+    r"(?:Macros.*?(?:Per\s+Serving|Per\s+Serve)?[^\n]*?)"
+    r"(?:(\d+)\s*Calories)?[^\n]*?"
+    r"(?:\|\s*)?(?:(\d+)\s*g?\s*Protein)?[^\n]*?"
+    r"(?:\|\s*)?(?:(\d+)\s*g?\s*Carbs?)?[^\n]*?"
+    r"(?:\|\s*)?(?:(\d+)\s*g?\s*Fat)?",
+    flags=re.IGNORECASE
+)
+
+SERVINGS_PATTERN = re.compile(
+    r"(?:Makes?\s*(\d+)|Serves?\s*(\d+)|Per\s*Serving\s*\(\s*(\d+)\s*Total\))",
+    re.IGNORECASE
+)
+
+SECTION_HEADERS = []
+
+_MACROS_BLOCK = re.compile(r"(Macros[^\n]*?)(?:\n|$)(.*?)(?:\n\s*\n|$)", re.IGNORECASE | re.DOTALL)
+_CALORIES = re.compile(r"(\d+)\s*Calories?", re.IGNORECASE)
+_PROTEIN = re.compile(r"(\d+)\s*g?\s*Proteins?", re.IGNORECASE)
+_PROTEIN_LABEL_FIRST = re.compile(r"Protein\s*[:\-]?\s*(\d+)\s*g?", re.IGNORECASE)
+_CARBS = re.compile(r"(\d+)\s*g?\s*Carbs?", re.IGNORECASE)
+_CARBS_LABEL_FIRST = re.compile(r"Carbs?\s*[:\-]?\s*(\d+)\s*g?", re.IGNORECASE)
+_FAT = re.compile(r"(\d+)\s*g?\s*Fat", re.IGNORECASE)
+_FAT_LABEL_FIRST = re.compile(r"Fat\s*[:\-]?\s*(\d+)\s*g?", re.IGNORECASE)
+_INGREDIENTS_MAKES = re.compile(r"Ingredients?\s*\(\s*Makes?\s*(\d+)\s*\)", re.IGNORECASE)
+
+# ---- section splitting ----
+_HASHTAG = re.compile(r"(#[A-Za-z0-9_]+)")
+_TRAILING_DOTS = re.compile(r"\n\.+\s*$", re.MULTILINE)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_NOTES = re.compile(r"\bNotes?\b\s*:?\s*(.+)$", re.IGNORECASE | re.DOTALL)
+_YOULL_NEED = re.compile(r"^\s*(?:👩‍🍳\s*)?You(?:'|’)?ll need\s*:?\s*(.*)$", re.IGNORECASE | re.MULTILINE)
+_INGREDIENTS_HEADER = re.compile(r"^\s*(?:👩‍🍳\s*)?Ingredients?\s*:?\s*$", re.IGNORECASE | re.MULTILINE)
+_INSTRUCTIONS_HEADER = re.compile(
+    r"^\s*(?:👩‍🍳\s*)?(Instructions?|Directions?|Steps?|To\s+make|Method)\s*:?\s*$",
+    re.IGNORECASE | re.MULTILINE)
+# after a "You'll need" block the header may not carry the chef emoji
+_PLAIN_INSTRUCTIONS_HEADER = re.compile(
+    r"^\s*(Instructions?|Directions?|Steps?|To\s+make|Method)\s*:?\s*$",
+    re.IGNORECASE | re.MULTILINE)
+_NUMBERED_START = re.compile(r"^\s*\d+\.\s+", re.MULTILINE)
+_ACTION_START = re.compile(r"^\s*(Cook|Bake|Shred|Stir|Mix|Add|Serve|Lower|Cover)\b.*",
+                           re.IGNORECASE | re.MULTILINE)
+
+# One pass over the caption finds the start of every line worth looking at.
+# The first five alternatives are loose supersets of the exact patterns the
+# splitter uses, so a line that could match is never skipped (the exact
+# pattern confirms it from that offset). They must not overlap each other
+# and must come before the informational kinds that follow.
+_TOKEN = re.compile(
+    r"^[^\S\n]*(?:"
+    r"(?P<you_need>(?:👩‍🍳\s*)?you(?:'|’)?ll need)"
+    r"|(?P<ingredients>(?:👩‍🍳\s*)?ingredients?[^\S\n]*:?[^\S\n]*$)"
+    r"|(?P<instructions>(?:👩‍🍳\s*)?(?:instructions?|directions?|steps?|to\s+make|method)[^\S\n]*:?[^\S\n]*$)"
+    r"|(?P<numbered>\d+\.)"
+    r"|(?P<action>(?:cook|bake|shred|stir|mix|add|serve|lower|cover)\b)"
+    r"|(?P<bullet>[•\-–*])"
+    r"|(?P<macros>macros)"
+    r"|(?P<servings>(?:makes?|serves?)\b)"
+    r"|(?P<notes>notes?\b)"
+    r")",
+    re.IGNORECASE | re.MULTILINE)
+
+# ---- ingredient / step lines ----
+_NEWLINES = re.compile(r"\n+")
+_STOP_HEADER = re.compile(r"^(?:👩‍🍳\s*)?(Instructions?|Directions?|Steps?)\s*:?\s*$", re.IGNORECASE)
+_LEADING_BULLET = re.compile(r"^[•\-\–\*]\s*")
+_NUMBERED_LINE = re.compile(r"^\s*\d+\.\s+.*", re.MULTILINE)
+_NUMBER_PREFIX = re.compile(r"^\s*\d+\.\s+")
+_INLINE_NUMBER_SPLIT = re.compile(r"\s(?=\d+\.\s)")
+_INLINE_NUMBER_PREFIX = re.compile(r"^\d+\.\s")
+_BULLET_SPLIT = re.compile(r"(?:\n[•\-\–]\s+|\s•\s+)")
+_SENTENCE_END = re.compile(r"[\.\!\?]\s+")
+_SENTENCE_SPLIT = re.compile(r"(?<=[\.\!\?])\s+")
+_STEP_PREFIX = re.compile(r"^[•\-\–\*\s]*\d+\.?\s*")
+
+ACTION_VERBS = [
+    'Cook', 'Bake', 'Shred', 'Stir', 'Mix', 'Add', 'Serve', 'Lower', 'Cover',
+    'Heat', 'Preheat', 'Sear', 'Fry', 'Roast', 'Simmer', 'Whisk', 'Combine',
+    'Fold', 'Blend', 'Divide', 'Chop', 'Slice', 'Dice', 'Boil', 'Reduce',
+    'Drain', 'Bake', 'Broil', 'Toast', 'Marinate'
+]
+_VERB_PAT = r"(?:" + r"|".join(re.escape(v) for v in ACTION_VERBS) + r")\b"
+# Split where an action verb starts a phrase: at the start of a line, after
+# a sentence end, or after a newline.
+_ACTION_SPLIT = re.compile(r"(?:(?<=^)|(?<=[\.\!\?]\s)|(?<=\n))(?=%s)" % _VERB_PAT,
+                           re.IGNORECASE | re.MULTILINE)
+# Number of the next step left at the end of a piece by the split above
+# ("Rinse the rice. 2." + "Cook ..."); only after a sentence end, so
+# "Bake for 20." keeps its minutes.
+_TRAILING_STEP_NUMBER = re.compile(r"(?<=[\.\!\?])\s+\d+\.$")
+
+
+def tokenize_caption(text):
+    """Classify the interesting lines of `text` in one pass.
+
+    Returns {kind: [offset, ...]} with the start offset of every line of
+    each kind, in order. Kinds: you_need, ingredients, instructions,
+    numbered, bullet, macros, servings, notes, action. Lines that fit no
+    kind are plain text and are not listed.
+    """
+    tokens = {}
+    for m in _TOKEN.finditer(text):
+        tokens.setdefault(m.lastgroup, []).append(m.start())
+    return tokens
+
+
+def _search_from(pattern, text, tokens, kind, base=0, line_start=0):
+    """pattern.search(text) where `text` is the tokenized caption from `base`.
+
+    Jumps straight to the first `kind` line that starts at or after
+    `line_start` (the start of the line holding `base`); when there is
+    none, the pattern cannot match and no search runs at all.
+    """
+    offsets = tokens.get(kind)
+    if not offsets:
+        return None
+    i = bisect_left(offsets, line_start)
+    if i >= len(offsets):
+        return None
+    return pattern.search(text, max(0, offsets[i] - base))
+
+
+def _tidy(text):
+    text = text.strip()
+    if "\n." in text:
+        text = _TRAILING_DOTS.sub("", text)
+    return text
+
+def clean_hashtags(text):
+    text = text or ""
+    if "#" in text:
+        text = _HASHTAG.sub("", text)
+    return _tidy(text)
+
+def extract_servings_and_macros(text):
+    text = text or ""
+    lowered = text.lower()
+
+    # Find a nearby "Macros" context line (same paragraph)
+    # Grab up to the next blank line to keep the numbers
+    m = _MACROS_BLOCK.search(text) if "macros" in lowered else None
+    if m:
+        # Combine header and next line just in case values are split
+        macros_block = (m.group(1) + " " + (m.group(2) or "")).strip()
+    else:
+        # Fallback: search the whole text
+        macros_block = text
+    block_lower = macros_block.lower() if m else lowered
+
+    # Value-first, order-agnostic captures (allow optional 'g' and case variants)
+    cal = None
+    pro = None
+    carb = None
+    fat = None
+
+    if "calorie" in block_lower:
+        m_cal = _CALORIES.search(macros_block)
+        if m_cal: cal = int(m_cal.group(1))
+
+    if "protein" in block_lower:
+        m_pro = _PROTEIN.search(macros_block) or _PROTEIN_LABEL_FIRST.search(macros_block)
+        if m_pro: pro = int(m_pro.group(1))
+
+    if "carb" in block_lower:
+        m_carb = _CARBS.search(macros_block) or _CARBS_LABEL_FIRST.search(macros_block)
+        if m_carb: carb = int(m_carb.group(1))
+
+    if "fat" in block_lower:
+        m_fat = _FAT.search(macros_block) or _FAT_LABEL_FIRST.search(macros_block)
+        if m_fat: fat = int(m_fat.group(1))
+
+    # Servings tolerant variants, including "Ingredients (Makes 5)"
+    servings = None
+    m_serv = None
+    if "make" in lowered or "serv" in lowered:
+        m_serv = SERVINGS_PATTERN.search(text)
+        if not m_serv:
+            m_serv = _INGREDIENTS_MAKES.search(text)
+    if m_serv:
+        for g in m_serv.groups():
+            if g and g.isdigit():
+                servings = int(g)
+                break
+
+    return servings, {"cal": cal, "protein": pro, "carbs": carb, "fat": fat}
+
+def split_sections_strict(caption):
+    text = clean_hashtags(caption or "")
+
+    blurb = ""
+    head_split = _PARAGRAPH_BREAK.split(text, maxsplit=1)
+    if len(head_split) == 2 and len(head_split[0]) < 220:
+        blurb = head_split[0].strip()
+        text = head_split[1].strip()
+
+    servings, macros = extract_servings_and_macros(text)
+    lowered = text.lower()
+    if "macros" in lowered:
+        text = MACRO_PATTERN.sub("", text)
+    if "make" in lowered or "serv" in lowered:
+        text = SERVINGS_PATTERN.sub("", text)
+
+    # Hashtags are already gone; only the whitespace/dot tidy-up that
+    # clean_hashtags also does is still needed after the substitutions.
+    ing_block, instr_block = _split_blocks(_tidy(text))
+
+    # Detect subsections in ingredients
+    sections = {}
+    found_sub = False
+    for label, pat in SECTION_HEADERS:
+        m = re.search(pat + r"\s*:?", ing_block)
+        if m:
+            found_sub = True
+    if found_sub:
+        # slice by subsections
+        order = []
+        for label, pat in SECTION_HEADERS:
+            m = re.search(pat + r"\s*:?", ing_block)
+            if m:
+                order.append((label, m.start()))
+        order.sort(key=lambda x: x[1])
+        for idx, (label, start) in enumerate(order):
+            end = order[idx+1][1] if idx+1 < len(order) else len(ing_block)
+            sections[label] = ing_block[start:end]
+    else:
+        sections["Ingredients"] = ing_block
+
+    ingredient_groups = {k: parse_ingredient_lines(v) for k, v in sections.items()}
+    instruction_steps = parse_numbered_steps(instr_block)
+    # If no numbered steps were found but we still have an instructions block,
+    # try to heuristically split it by common cooking action verbs so we get
+    # a reasonable list of steps for rendering.
+    if not instruction_steps and instr_block:
+        instruction_steps = split_instructions_by_actions(instr_block)
+
+    # Optional notes line at end
+    notes = ""
+    if "note" in text.lower():
+        notes_match = _NOTES.search(text)
+        if notes_match:
+            notes = parse_typography(notes_match.group(1))
+
+    return {
+        "blurb": blurb,
+        "servings": servings,
+        "macros": macros,
+        "ingredients": ingredient_groups,
+        "instructions": instruction_steps,
+        "notes": notes
+    }
+
+
+def split_ingredients_and_instructions(text):
+    """
+    Return (ingredients_block, instructions_block)
+    - Recognizes 'Ingredients' and 'Instructions/Directions/Steps' headers
+    - If instructions header missing, uses first line that starts with a number+dot
+      as the beginning of instructions.
+    """
+    return _split_blocks(clean_hashtags(text) or "")
+
+def _split_blocks(t):
+    # Normalize bullets and whitespace
+    t = t.replace("\r", "")
+    tokens = tokenize_caption(t)
+
+    # Special-case: "You'll need:" (allow straight or curly apostrophe) where
+    # the header may include ingredients on the same line. If found, return
+    # only the text after that header as the ingredients block.
+    # Allow an optional chef emoji prefix (👩‍🍳) before the header
+    m_you = _search_from(_YOULL_NEED, t, tokens, "you_need")
+    if m_you:
+        prefix = (m_you.group(1) or "").strip()
+        rest = t[m_you.end():]
+        # Look for an instructions header following the "You'll need" block
+        m_instr2 = _search_from(_PLAIN_INSTRUCTIONS_HEADER, rest, tokens, "instructions",
+                                m_you.end(), t.rfind("\n", 0, m_you.end()) + 1)
+        if m_instr2:
+            ing_block = (prefix + "\n" + rest[:m_instr2.start()]).strip()
+            instr_block = rest[m_instr2.end():].strip()
+        else:
+            ing_block = (prefix + "\n" + rest).strip()
+            instr_block = ""
+        return ing_block, instr_block
+
+    # Find the 'Ingredients' header
+    # Match headings like "👩‍🍳 INGREDIENTS" or plain "Ingredients"
+    m_ing = _search_from(_INGREDIENTS_HEADER, t, tokens, "ingredients")
+    start = m_ing.end() if m_ing else 0
+    after_ing = t[start:].strip()
+    # where after_ing starts within t, for looking up tokens
+    base = len(t) - len(t[start:].lstrip())
+    line_start = t.rfind("\n", 0, base) + 1
+
+    # Try to find explicit instructions header (include 'To make')
+    # Recognize '👩‍🍳 DIRECTIONS', 'Directions', 'To make', etc.
+    m_instr = _search_from(_INSTRUCTIONS_HEADER, after_ing, tokens, "instructions", base, line_start)
+    if m_instr:
+        ing_block = after_ing[:m_instr.start()].strip()
+        instr_block = after_ing[m_instr.end():].strip()
+        return ing_block, instr_block
+
+    # Fallback: detect first numbered step line as start of instructions
+    m_num = _search_from(_NUMBERED_START, after_ing, tokens, "numbered", base, line_start)
+    if m_num:
+        ing_block = after_ing[:m_num.start()].strip()
+        instr_block = after_ing[m_num.start():].strip()
+        return ing_block, instr_block
+
+    # Fallback: if we see bullet-like cooking verbs, split on first 'Cook|Bake|Shred|Mix|Add|Serve'
+    m_verb = _search_from(_ACTION_START, after_ing, tokens, "action", base, line_start)
+    if m_verb:
+        ing_block = after_ing[:m_verb.start()].strip()
+        instr_block = after_ing[m_verb.start():].strip()
+        return ing_block, instr_block
+
+    # No detection, treat all as ingredients
+    return after_ing, ""
+
+def parse_ingredient_lines(block):
+    lines = []
+    for raw in _NEWLINES.split(block):
+        s = raw.strip()
+        if not s:
+            continue
+        # Stop if this is a section header mistakenly in the block
+        # Accept headings like "👩‍🍳 DIRECTIONS" as well
+        if _STOP_HEADER.match(s):
+            break
+        # Remove leading bullets/dashes
+        s = _LEADING_BULLET.sub("", s)
+        lines.append(parse_typography(s))
+    return lines
+
+def parse_numbered_steps(block):
+    block = (block or "").strip()
+    if not block:
+        return []
+    # First, split when steps are on separate lines starting with 1., 2., etc.
+    lines = _NUMBERED_LINE.findall(block)
+    if lines and len(lines) > 1:
+        steps = (_NUMBER_PREFIX.sub("", ln).strip() for ln in lines)
+        return [parse_typography(s) for s in steps if _STEP_PREFIX.sub("", s)]
+
+    # If not found, split inline '1. ... 2. ...' within one paragraph
+    chunks = _INLINE_NUMBER_SPLIT.split(block)  # keep numbers by splitting before them
+    steps = []
+    buf = ""
+    for ch in chunks:
+        if _INLINE_NUMBER_PREFIX.match(ch):
+            if buf:
+                steps.append(buf.strip())
+            buf = _INLINE_NUMBER_PREFIX.sub("", ch)
+        else:
+            buf += " " + ch
+    if buf.strip():
+        steps.append(buf.strip())
+
+    # As a final fallback, split on bullets
+    if len(steps) <= 1:
+        steps = [parse_typography(x) for x in _BULLET_SPLIT.split(block) if x.strip()]
+
+    # If we still have a single (long) step but the block contains multiple
+    # sentence boundaries, try to split by action verbs / sentences to get
+    # more granular steps (fixes cases where the author didn't number steps).
+    if len(steps) <= 1 and _SENTENCE_END.search(block):
+        # Defer to the action-based splitter which will also fall back to
+        # sentence splitting when appropriate.
+        return split_instructions_by_actions(block)
+
+    # a lone "3." line is a step number with nothing after it, not a step
+    return [parse_typography(s) for s in steps if s and _STEP_PREFIX.sub("", s)]
+
+
+def split_instructions_by_actions(block):
+    """Split a free-form instructions block into steps by common cooking actions.
+
+    Heuristic: split on newlines first; if that yields a single long paragraph,
+    split on locations where an action verb starts a sentence/phrase (e.g.
+    "Cook", "Bake", "Mix", "Add", ...). Returns a list of cleaned steps.
+    """
+    if not block:
+        return []
+
+    # First split by explicit newlines and discard tiny lines
+    lines = [ln.strip() for ln in _NEWLINES.split(block) if ln.strip()]
+    if len(lines) > 1:
+        # Clean up lines: remove leading bullets and numbers
+        cleaned = []
+        for ln in lines:
+            ln2 = _STEP_PREFIX.sub("", ln).strip()
+            if ln2:
+                cleaned.append(parse_typography(ln2))
+        return cleaned
+
+    # Single paragraph: split where an action verb starts a sentence/phrase.
+    # This captures sequences like "1. Cook... 2. Mix..." without numbers,
+    # or sentences that start with verbs.
+    # The step number isn't a sentence end: drop it first so "1. Cook ..."
+    # doesn't split into "1" and "Cook ...".
+    block = _NUMBER_PREFIX.sub("", _LEADING_BULLET.sub("", block.strip()))
+    steps = [parse_typography(_TRAILING_STEP_NUMBER.sub("", p.strip()))
+             for p in _ACTION_SPLIT.split(block) if p and p.strip()]
+
+    # As a final fallback, split on sentence boundaries
+    if not steps:
+        sents = _SENTENCE_SPLIT.split(block)
+        steps = [parse_typography(s.strip()) for s in sents if s.strip()]
+
+    # If we still only have a single long step, try a simpler sentence split
+    # which often breaks up run-on instruction paragraphs (helps cases like
+    # recipe 16 where many sentences were joined into one paragraph).
+    if len(steps) <= 1:
+        sents = _SENTENCE_SPLIT.split(block)
+        sents_clean = [parse_typography(s.strip()) for s in sents if s.strip()]
+        if len(sents_clean) > 1:
+            return sents_clean
+
+    return steps
+
+
+_ICON_SERVINGS = re.compile(r"(serves|portions?)\s*:?[\s]*([0-9]+)", re.IGNORECASE)
+_ICON_TIME = re.compile(r"([0-9]+)[\s]*(minutes?|mins?|hr|hours?)", re.IGNORECASE)
+
+def parse_icons(text):
+    servings, time = "", ""
+    servings_match = _ICON_SERVINGS.search(text or "")
+    time_match = _ICON_TIME.search(text or "")
+    if servings_match:
+        servings = servings_match.group(2)
+    if time_match:
+        time = time_match.group(0)
+    return servings, time
@@ -0,0 +1,303 @@
+"""On-disk caches that let cookbook rebuilds skip Instagram."""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+def _atomic_write_text(path, text):
+    # Write next to the target then rename, so a crash mid-write never
+    # leaves a truncated entry behind for the next run to trip over.
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _atomic_write_json(path, data):
+    _atomic_write_text(path, json.dumps(data, ensure_ascii=False))
+
+
+class MetadataCache:
+    """Per-shortcode post metadata (title, caption, thumbnail URL).
+
+    One JSON file per shortcode under `root`. Entries older than `ttl`
+    seconds are treated as misses (`ttl=None` keeps them forever) and
+    `force_refresh=True` ignores every entry so all reels are refetched.
+    Shortcodes passed to `pin()` never expire, which lets a resumed run
+    reuse what it already fetched however long ago that was.
+    """
+
+    def __init__(self, root, ttl=None, force_refresh=False):
+        self.root = root
+        self.ttl = ttl
+        self.force_refresh = force_refresh
+        self.pinned = set()
+
+    def path(self, code):
+        return os.path.join(self.root, f"{code}.json")
+
+    def pin(self, codes):
+        self.pinned.update(codes)
+
+    def get(self, code):
+        if self.force_refresh or not code:
+            return None
+        try:
+            with open(self.path(code), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        fetched_at = entry.get("fetched_at") or 0
+        if self.ttl is not None and code not in self.pinned and time.time() - fetched_at > self.ttl:
+            return None
+        return entry
+
+    def put(self, code, title, caption, thumbnail_url):
+        entry = {
+            "shortcode": code,
+            "title": title,
+            "caption": caption,
+            "thumbnail_url": thumbnail_url,
+            "fetched_at": time.time(),
+        }
+        _atomic_write_json(self.path(code), entry)
+        return entry
+
+    def invalidate(self, code):
+        try:
+            os.remove(self.path(code))
+        except OSError:
+            pass
+
+
+class RunManifest:
+    """Per-shortcode progress of a batch, so an interrupted run resumes.
+
+    Items move forward through STATES; `fail()` records why an item
+    stopped, and failed items count as unfinished. Every change is
+    appended to a JSON-lines journal at `path`, so a crash loses at most
+    the line being written. Loading replays the journal and compacts it.
+    """
+
+    STATES = ("pending", "fetched", "image-ready", "parsed")
+    FAILED = "failed"
+
+    def __init__(self, path):
+        self.path = path
+        self.items = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    if entry.get("code"):
+                        self.items.setdefault(entry["code"], {}).update(entry)
+        except OSError:
+            return
+        self._compact()
+
+    def _compact(self):
+        text = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self.items.values())
+        _atomic_write_text(self.path, text)
+
+    def _record(self, code, **changes):
+        with self._lock:
+            entry = self.items.setdefault(code, {"code": code})
+            entry.update(changes, at=time.time())
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def state(self, code):
+        entry = self.items.get(code)
+        return entry["state"] if entry else None
+
+    def finished(self, code):
+        return self.state(code) == self.STATES[-1]
+
+    def add(self, code, url):
+        """Register `code` as pending unless the manifest already knows it."""
+        if code not in self.items:
+            self._record(code, url=url, state="pending", reason=None)
+
+    def advance(self, code, state):
+        """Move `code` to `state`; never moves a finished step backwards."""
+        current = self.state(code)
+        if current in self.STATES and self.STATES.index(current) >= self.STATES.index(state):
+            return
+        self._record(code, state=state, reason=None)
+
+    def fail(self, code, reason):
+        self._record(code, state=self.FAILED, reason=str(reason))
+
+    def reset(self):
+        for code in list(self.items):
+            self._record(code, state="pending", reason=None)
+
+    def counts(self, codes=None):
+        counts = {}
+        for code in (self.items if codes is None else codes):
+            state = self.state(code) or "pending"
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+
+class SyncMark:
+    """High-water mark for syncing a newest-first feed such as saved posts.
+
+    Keeps the shortcodes at the head of the feed as of the last sync. The
+    next sync walks the feed until it meets any of them. Several are kept,
+    not one, so un-saving the newest post doesn't trigger a full re-walk.
+    """
+
+    def __init__(self, path, keep=20):
+        self.path = path
+        self.keep = keep
+        self.head = []
+        self.synced_at = None
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.head = list(data.get("head") or [])
+            self.synced_at = data.get("synced_at")
+        except (OSError, ValueError):
+            pass
+
+    def seen(self, code):
+        return code in self.head
+
+    def advance(self, new_codes):
+        """Record `new_codes` (newest first) as the new head of the feed."""
+        self.head = (list(new_codes) + [c for c in self.head if c not in new_codes])[:self.keep]
+        self.synced_at = time.time()
+        _atomic_write_json(self.path, {"head": self.head, "synced_at": self.synced_at})
+
+
+class ImageStore:
+    """Content-addressed store for finished build artifacts: rounded,
+    encoded thumbnails and (with `suffix=".pdf"`) rendered recipe fragments.
+
+    Entries are keyed by a hash of the source (shortcode or URL) plus every
+    parameter that affects the output, so a hit can be used as-is.
+    The store is capped at `max_bytes`; the least recently used files go
+    first. Files handed out during this process are never evicted, because
+    the PDF build still needs them.
+    """
+
+    def __init__(self, root, max_bytes=None, suffix=".png"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._pinned = set()
+        self._index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(source, **params):
+        payload = json.dumps({"source": source, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + self.suffix)
+
+    def _load_index(self):
+        # path -> [mtime, size]; scanned once, then kept current by get/put.
+        # Every file counts, not just `suffix` ones, so entries written in an
+        # older format (e.g. .png thumbnails) age out under the same cap.
+        if self._index is None:
+            self._index = {}
+            for folder, _dirs, files in os.walk(self.root):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    p = os.path.join(folder, name)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    self._index[p] = [st.st_mtime, st.st_size]
+        return self._index
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            # mtime doubles as the LRU clock; atime is unreliable (noatime)
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._pinned.add(path)
+            if self._index is not None and path in self._index:
+                self._index[path][0] = time.time()
+        return path
+
+    def put(self, key, src_path):
+        """Move the finished file at `src_path` into the store."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(src_path, path)
+        except OSError:
+            # different filesystem (e.g. /tmp on tmpfs): copy then drop
+            shutil.copyfile(src_path, path + ".tmp")
+            os.replace(path + ".tmp", path)
+            try:
+                os.remove(src_path)
+            except OSError:
+                pass
+        with self._lock:
+            self._pinned.add(path)
+            index = self._load_index()
+            index[path] = [time.time(), os.path.getsize(path)]
+        self.evict()
+        return path
+
+    def put_bytes(self, key, data):
+        """Store finished image bytes directly (in-memory image mode)."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self.put(key, tmp)
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            index = self._load_index()
+            total = sum(size for _mtime, size in index.values())
+            if total <= self.max_bytes:
+                return
+            for p, (_mtime, size) in sorted(index.items(), key=lambda kv: kv[1][0]):
+                if total <= self.max_bytes:
+                    break
+                if p in self._pinned:
+                    continue
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                del index[p]
+                total -= size
@@ -0,0 +1,141 @@
+"""Pooled, streaming HTTP downloads with conditional revalidation."""
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cookbook_cache import ImageStore
+
+# 429 is not retried here: it goes straight back to the caller, whose rate
+# limiter has to see throttling the first time it happens to back off.
+RETRY_STATUS = {500, 502, 503, 504}
+
+
+class Downloader:
+    """Download files into `root`, reusing connections and earlier copies.
+
+    One keep-alive `requests.Session` is shared by every caller (it is safe
+    to use from several threads). Each host gets at most `per_host`
+    connections; extra threads wait for a free one. Bodies are streamed to
+    disk in chunks. The response's ETag/Last-Modified is saved next to the
+    file, so the next download of the same key sends a conditional GET and
+    a 304 reuses the local copy. Connection errors and 5xx responses are
+    retried with jittered exponential backoff; a 429 is raised at once.
+    Saved bodies live in an ImageStore capped at `max_bytes`, so the least
+    recently used ones are dropped like finished thumbnails are.
+    """
+
+    def __init__(self, root, per_host=4, retries=3, backoff=0.5, timeout=20,
+                 chunk_size=64 * 1024, headers=None, max_bytes=None):
+        self.root = root
+        self.store = ImageStore(root, max_bytes, suffix=".bin")
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        self.session.headers.update(headers or {"User-Agent": "Mozilla/5.0"})
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=per_host, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _paths(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        body_path = self.store.path(digest)
+        return digest, body_path, os.path.splitext(body_path)[0] + ".json"
+
+    def _validators(self, body_path, meta_path):
+        if not os.path.exists(body_path):
+            return {}
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = self.backoff * (2 ** attempt)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        # jitter so parallel workers don't retry in lockstep
+        time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def fetch(self, url, key=None, headers=None, timeout=None):
+        """Return a local path holding the body of `url`.
+
+        `key` names the local copy (defaults to the URL). Pass something
+        stable, such as a shortcode, when the URL itself changes between
+        runs (e.g. re-signed CDN links) so revalidation can still apply.
+        """
+        return self._fetch(url, key, headers, timeout, in_memory=False)
+
+    def fetch_bytes(self, url, key=None, headers=None, timeout=None):
+        """Like fetch(), but return the body as bytes without writing it.
+
+        A copy saved by an earlier fetch() is still revalidated and reused.
+        """
+        return self._fetch(url, key, headers, timeout, in_memory=True)
+
+    def _fetch(self, url, key, headers, timeout, in_memory):
+        digest, body_path, meta_path = self._paths(key or url)
+        for attempt in range(self.retries + 1):
+            req_headers = dict(headers or {})
+            req_headers.update(self._validators(body_path, meta_path))
+            try:
+                with self.session.get(url, headers=req_headers, timeout=timeout or self.timeout,
+                                      stream=True) as r:
+                    if r.status_code == 304:
+                        self.store.get(digest)
+                        if in_memory:
+                            with open(body_path, "rb") as f:
+                                return f.read()
+                        return body_path
+                    if r.status_code in RETRY_STATUS and attempt < self.retries:
+                        self._sleep_before_retry(attempt, r)
+                        continue
+                    r.raise_for_status()
+                    if in_memory:
+                        return b"".join(r.iter_content(chunk_size=self.chunk_size))
+                    self._write_body(r, digest, body_path)
+                    meta = {
+                        "url": url,
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                    }
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                return body_path
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                self._sleep_before_retry(attempt)
+        raise RuntimeError(f"download failed after {self.retries + 1} attempts: {url}")
+
+    def _write_body(self, response, digest, body_path):
+        folder = os.path.dirname(body_path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if chunk:
+                        f.write(chunk)
+            self.store.put(digest, tmp)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
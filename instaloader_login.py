@@ -1,3 +1,5 @@
+import json
+import os
 from argparse import ArgumentParser
 from glob import glob
 from os.path import expanduser
@@ -6,19 +8,50 @@ from sqlite3 import OperationalError, connect
 
 try:
     from instaloader import ConnectionException, Instaloader
+    from instaloader.instaloader import get_default_session_filename
 except ModuleNotFoundError:
     raise SystemExit("Instaloader not found.\n  pip install [--user] instaloader")
 
 
-def get_cookiefile():
+def get_cookiefiles():
     default_cookiefile = {
         "Windows": "~/AppData/Roaming/Mozilla/Firefox/Profiles/*/cookies.sqlite",
         "Darwin": "~/Library/Application Support/Firefox/Profiles/*/cookies.sqlite",
     }.get(system(), "~/.mozilla/firefox/*/cookies.sqlite")
-    cookiefiles = glob(expanduser(default_cookiefile))
+    cookiefiles = sorted(glob(expanduser(default_cookiefile)))
     if not cookiefiles:
         raise SystemExit("No Firefox cookies.sqlite file found. Use -c COOKIEFILE.")
-    return cookiefiles[0]
+    return cookiefiles
+
+
+def get_cookiefile():
+    return get_cookiefiles()[0]
+
+
+def pool_file(pool):
+    """Where the usernames of session pool `pool` are listed, next to
+    Instaloader's own session files."""
+    return os.path.join(os.path.dirname(get_default_session_filename("")), f"pool-{pool}.json")
+
+
+def load_pool(pool):
+    """Usernames in session pool `pool`; each has a session file that
+    `Instaloader.load_session_from_file(username)` can read."""
+    try:
+        with open(pool_file(pool), encoding="utf-8") as f:
+            return json.load(f)["usernames"]
+    except FileNotFoundError:
+        raise SystemExit(f"No session pool named {pool!r}. Create it with:\n"
+                         f"  python instaloader_login.py --pool {pool} --all-profiles")
+
+
+def save_pool(pool, usernames):
+    path = pool_file(pool)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"usernames": usernames}, f, indent=2)
+    os.replace(tmp, path)
 
 
 def import_session(cookiefile, sessionfile):
@@ -40,14 +73,55 @@ def import_session(cookiefile, sessionfile):
     print("Imported session cookie for {}.".format(username))
     instaloader.context.username = username
     instaloader.save_session_to_file(sessionfile)
+    return username
 
 
-if __name__ == "__main__":
-    p = ArgumentParser()
-    p.add_argument("-c", "--cookiefile")
+def import_pool(cookiefiles, pool):
+    """Import a session from each cookie file into the named pool.
+
+    Profiles that fail to import (logged out, locked database) are skipped
+    with a warning; profiles logged into the same account are kept once.
+    Accounts already in the pool stay there. Returns the pool's usernames.
+    """
+    try:
+        usernames = load_pool(pool)
+    except SystemExit:
+        usernames = []
+    for cookiefile in cookiefiles:
+        try:
+            username = import_session(cookiefile, None)
+        except (ConnectionException, OperationalError, SystemExit) as e:
+            print("Skipping {}: {}".format(cookiefile, e))
+            continue
+        if username not in usernames:
+            usernames.append(username)
+    if not usernames:
+        raise SystemExit("No sessions imported; pool {!r} not written.".format(pool))
+    save_pool(pool, usernames)
+    print("Session pool {!r}: {}".format(pool, ", ".join(usernames)))
+    return usernames
+
+
+def main(argv=None, prog=None):
+    p = ArgumentParser(prog=prog)
+    p.add_argument("-c", "--cookiefile", action="append",
+                   help="Firefox cookies.sqlite to import (repeat to fill a --pool)")
     p.add_argument("-f", "--sessionfile")
-    args = p.parse_args()
+    p.add_argument("-p", "--pool", help="add the imported sessions to this named session pool")
+    p.add_argument("-a", "--all-profiles", action="store_true",
+                   help="import from every Firefox profile instead of the first")
+    args = p.parse_args(argv)
+    cookiefiles = args.cookiefile or (get_cookiefiles() if args.all_profiles else [get_cookiefile()])
+    if args.pool:
+        import_pool(cookiefiles, args.pool)
+        return
+    if len(cookiefiles) > 1:
+        raise SystemExit("Several cookie files need --pool NAME.")
     try:
-        import_session(args.cookiefile or get_cookiefile(), args.sessionfile)
+        import_session(cookiefiles[0], args.sessionfile)
     except (ConnectionException, OperationalError) as e:
-        raise SystemExit("Cookie import failed: {}".format(e))
\ No newline at end of file
+        raise SystemExit("Cookie import failed: {}".format(e))
+
+
+if __name__ == "__main__":
+    main()
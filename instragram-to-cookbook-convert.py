@@ -1,21 +1,25 @@
-import instaloader
-import qrcode
-from bs4 import BeautifulSoup  # kept for future extensions
 from reportlab.lib.pagesizes import A4, LETTER
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak, Table, TableStyle,
-    ListFlowable, ListItem, HRFlowable, KeepTogether, Flowable
-)
-from reportlab.lib.utils import ImageReader
 from reportlab.lib.units import inch
 import tempfile
+import hashlib
+from argparse import REMAINDER, ArgumentParser
+import io
+import json
 import os
-import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
 from math import ceil
-from PIL import Image as PILImg, ImageOps, ImageDraw
-import requests
+from urllib.parse import urlsplit
+from rate_limit import AdaptiveRateLimiter, SessionPool, classify_error
+from caption_parser import PARSER_VERSION, clean_title, split_sections_strict
+from cookbook_cache import ImageStore, MetadataCache, RunManifest, SyncMark
+from recipe_store import Recipe, RecipeLibrary, import_recipes
+from stage_timing import StageTimer
  
 # -------- CONFIG --------
 REEL_URLS = [
@@ -42,6 +46,93 @@ REEL_URLS = [
     ]
 OUTPUT_PDF = "instagram-cookbook.pdf"
 SESSION_USER = "your_instagram_username"  # for private reels access
+# Name of a session pool made with `instaloader_login.py --pool NAME`; when
+# set, reels are spread over all of its accounts and SESSION_USER is unused.
+SESSION_POOL = None
+# Number of reels fetched at the same time (per session when using a pool).
+# 1 restores the strictly serial walk.
+FETCH_WORKERS = 4
+# Ceiling on requests one session sends to Instagram from all fetch workers
+# combined (metadata lookups and thumbnail downloads share the same budget).
+MAX_REQUESTS_PER_MINUTE = 40
+# Per-account overrides of MAX_REQUESTS_PER_MINUTE, e.g. {"old_account": 60}.
+SESSION_LIMITS = {}
+RATE_LIMIT_BURST = 4
+# When Instagram starts throttling, the rate is halved step by step down to
+# this floor and everything pauses (THROTTLE_PAUSE seconds, doubling while
+# it keeps happening); it climbs back once requests go through again.
+MIN_REQUESTS_PER_MINUTE = 4
+THROTTLE_PAUSE = 60
+# This many throttles/connection errors in a row open the circuit breaker:
+# no requests until a cooldown passes and a single probe succeeds. Past
+# MAX_THROTTLE_PAUSE seconds of cooldown the rest of the batch is marked
+# failed so a later run can resume it.
+CIRCUIT_FAILURES = 5
+MAX_THROTTLE_PAUSE = 30 * 60
+# Local cache so reruns don't ask Instagram for reels they already know.
+CACHE_DIR = ".cookbook-cache"
+# Every fetched recipe, parsed, with its thumbnail; `--render-only` builds
+# the cookbook from here without contacting Instagram.
+LIBRARY_PATH = os.path.join("recipe-library", "recipes.sqlite")
+META_CACHE_TTL = 7 * 24 * 3600  # seconds; None keeps entries forever
+FORCE_REFRESH = False  # ignore cached metadata and refetch every reel
+# Finished rounded thumbnails are kept too, least recently used dropped first.
+IMAGE_CACHE_MAX_MB = 256
+THUMB_RADIUS_RATIO = 0.07
+# Bump when crop_and_effects changes output so stale thumbnails are redone.
+THUMB_EFFECTS_VERSION = 2
+# How thumbnails are encoded for the PDF: pixels per inch at the size they
+# are drawn, and JPEG quality. "screen" keeps phone-friendly file sizes;
+# "print" and "archive" trade size for detail.
+IMAGE_PROFILES = {
+    "screen": {"dpi": 110, "quality": 72},
+    "print": {"dpi": 300, "quality": 88},
+    "archive": {"dpi": 600, "quality": 95},
+}
+IMAGE_PROFILE = "screen"
+# Rounded corners are flattened onto the recipe card colour so thumbnails
+# need no alpha channel (which would force lossless PNG). Thumbnails that
+# end up stacked straight on the page are moved onto PAGE_BACKGROUND.
+THUMB_MATTE = "#FFF9F3"
+PAGE_BACKGROUND = "#FDF8F0"
+# Thumbnail downloads share one keep-alive session; unchanged CDN images are
+# revalidated with a conditional GET instead of downloaded again.
+DOWNLOAD_CONNECTIONS_PER_HOST = 4
+DOWNLOAD_RETRIES = 3
+# The raw downloads kept for revalidation are capped like IMAGE_CACHE_MAX_MB.
+DOWNLOAD_CACHE_MAX_MB = 512
+# Processes used to round, resize and QR-encode images before layout.
+IMAGE_WORKERS = os.cpu_count() or 1
+# Keep thumbnails and QR codes as in-memory buffers from download through
+# PIL to ReportLab, instead of writing a temp file at every step.
+IN_MEMORY_IMAGES = False
+# "vector" draws QR codes as PDF paths (crisp, tiny, memoized per URL);
+# "raster" embeds a PNG from qrcode.make as before.
+QR_MODE = "vector"
+# Render each recipe to its own cached PDF fragment and merge them, so a
+# rebuild only lays out new or changed recipes (needs pypdf). Each recipe
+# then starts on a fresh page.
+INCREMENTAL_BUILD = False
+# Cached fragments are capped like thumbnails, least recently used first.
+FRAGMENT_CACHE_MAX_MB = 512
+# Bump when the page layout changes so cached fragments are re-rendered.
+LAYOUT_VERSION = 2
+# Stream recipes from fetch through image prep into the PDF one at a time
+# instead of collecting them all first; memory stays flat for huge books.
+STREAMING_BUILD = False
+# Processes used to lay out the PDF. Above 1 the book is rendered in that
+# many shards side by side and merged (needs pypdf); each shard starts on
+# a fresh page. Also renders changed fragments in INCREMENTAL_BUILD mode.
+RENDER_WORKERS = 1
+# `parse --jsonl` (bulk parsing of caption archives): processes, and how
+# many captions each one is handed at a time.
+PARSE_WORKERS = os.cpu_count() or 1
+PARSE_CHUNK_SIZE = 500
+# Where to write per-stage timings (fetch, download, effects, parse, layout,
+# QR, build...): a JSON report and/or a Prometheus textfile for
+# node_exporter's textfile collector. None skips the file.
+TIMING_REPORT = None
+PROMETHEUS_TEXTFILE = None
 # ------------------------
 
 # Set True to print parsed/cleaned caption output and skip PDF build.
@@ -52,27 +143,71 @@ DEBUG_LAYOUT = False
 # right-column heights and prints a compact report (does not build PDF).
 DEBUG_DIAGNOSTICS = False
 
+# Directory to profile a normal run into (hotspots.txt, stacks.collapsed for
+# flamegraph tools, profile.pstats); None runs unprofiled. "cprofile" gives
+# exact call counts, "sample" only samples stacks and barely slows the run.
+# Set IMAGE_WORKERS/RENDER_WORKERS to 1 to see that work in the profile.
+PROFILE_DIR = None
+PROFILE_MODE = "cprofile"
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+
 # Size constraints for native-size placement
 MAX_W = 4.9 * inch
 MAX_H = 4.7 * inch
 
 def shortcode_from_url(url: str):
     try:
-        parts = [p for p in url.split("/") if p]
+        # share links carry ?igsh=... / ?utm_source=...; only the path matters
+        parts = [p for p in urlsplit(url.strip()).path.split("/") if p]
         for i, seg in enumerate(parts):
-            if seg in ("reel", "p"):
+            if seg in ("reel", "reels", "p", "tv"):
                 if i + 1 < len(parts):
                     return parts[i + 1]
         return parts[-1]
     except Exception:
         return None
 
+def read_urls(source):
+    """URLs from a file, or stdin for "-": whitespace separated, with
+    blank lines and #-comments ignored."""
+    f = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        urls = []
+        for line in f:
+            if not line.lstrip().startswith("#"):
+                urls.extend(line.split())
+        return urls
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def dedupe_urls(urls):
+    """Return [(shortcode, url)] keeping the first URL seen per shortcode."""
+    seen = {}
+    for url in urls:
+        code = shortcode_from_url(url)
+        if not code:
+            print(f"⚠️ Could not parse shortcode from URL: {url}")
+            continue
+        seen.setdefault(code, url)
+    return list(seen.items())
+
 IMG_COL_W = 2.8 * inch
 IMG_ASPECT = 1  # height/width; for 4:3 use 0.75, for 3:2 use 0.66
 TEXT_COL_W = 3.6 * inch    # text/ingredients column width
 GUTTER = 0.2 * inch
 
+# Boxes create_pdf draws the thumbnail and QR code into; prepare_images()
+# resizes to these ahead of time so layout only has to place them.
+THUMB_BOX_W = 3.0 * inch
+THUMB_BOX_H = (LETTER[1] - (0.75*inch + 0.75*inch)) * 0.6
+QR_BOX = 1.1 * inch
+
 def make_top_block(img_path, styles, title, summary_bits, blurb, ing_groups):
+    from PIL import Image as PILImg
+    from reportlab.lib import colors
+    from reportlab.platypus import HRFlowable, Image, ListFlowable, ListItem, Paragraph, Spacer, Table, TableStyle
+
     # Left: image (scaled to column width)
     img_h = IMG_COL_W * IMG_ASPECT
     # Create Image flowable and explicitly restrict its size so the Table
@@ -236,6 +371,8 @@ def make_top_block(img_path, styles, title, summary_bits, blurb, ing_groups):
     return t
 
 def add_image_native_size(path):
+    from reportlab.platypus import Image
+
     img_flow = Image(path)
     iw, ih = img_flow.imageWidth, img_flow.imageHeight
     scale = min(1.0, MAX_W / iw, MAX_H / ih)
@@ -245,384 +382,257 @@ def add_image_native_size(path):
     img_flow.hAlign = "CENTER"
     return img_flow
 
-def crop_and_effects(image_path, radius_ratio=0.07):
-    # Rounded corners only (no black box)
-    with PILImg.open(image_path) as img:
+def _image_input(src):
+    """Images travel either as a file path or as encoded bytes."""
+    return io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src
+
+def _image_label(src):
+    return src if isinstance(src, str) else f"<in-memory image, {len(src)} bytes>"
+
+def crop_and_effects(image_path, radius_ratio=0.07, as_bytes=False, max_size=None, matte=None,
+                     quality=None):
+    # Rounded corners only (no black box). With `matte` the corners are
+    # filled with that colour and the result is a JPEG at `quality`;
+    # `max_size` (w, h pixels) downsizes first so big photos stay cheap.
+    from PIL import Image as PILImg, ImageDraw
+
+    with PILImg.open(_image_input(image_path)) as img:
         img = img.convert("RGBA")
+        if max_size:
+            img.thumbnail(max_size, PILImg.LANCZOS)
         w, h = img.size
         radius = int(min(w, h) * radius_ratio)
         mask = PILImg.new("L", (w, h), 0)
         draw = ImageDraw.Draw(mask)
         draw.rounded_rectangle((0, 0, w, h), radius=radius, fill=255)
+        if matte:
+            flat = PILImg.new("RGB", (w, h), matte)
+            flat.paste(img, mask=mask)
+            options = {"format": "JPEG", "quality": quality or 85, "optimize": True}
+            if as_bytes:
+                buf = io.BytesIO()
+                flat.save(buf, **options)
+                return buf.getvalue()
+            out = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
+            flat.save(out.name, **options)
+            return out.name
         img.putalpha(mask)
+        if as_bytes:
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+            return buf.getvalue()
         out = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
         img.save(out.name)
         return out.name
 
-def clean_title(title, max_length=60):
-    clean = re.sub(r"^[^:]+ on Instagram:\s*", "", title or "")
-    clean = clean.strip("\"'“”")
-    if len(clean) <= max_length:
-        return clean if clean else "Untitled Recipe"
-    i = clean.rfind(" ", 0, max_length)
-    first_line = clean[:i] + "…" if i > 0 else clean[:max_length] + "…"
-    return first_line
-
-def parse_typography(s):
-    s = re.sub(r"\b1/2\b", "½", s or "")
-    s = re.sub(r"\b1/4\b", "¼", s)
-    s = re.sub(r"\b3/4\b", "¾", s)
-    s = re.sub(r"(\d)\s*-\s*(\d)", r"\1–\2", s)
-    s = re.sub(r'\s+', ' ', s)
-    return s.strip(" .")
-
-# ---- Improved macros/servings/sections parsing ----
-MACRO_PATTERN = re.compile(
-    r"(?:Macros.*?(?:Per\s+Serving|Per\s+Serve)?[^\n]*?)"
-    r"(?:(\d+)\s*Calories)?[^\n]*?"
-    r"(?:\|\s*)?(?:(\d+)\s*g?\s*Protein)?[^\n]*?"
-    r"(?:\|\s*)?(?:(\d+)\s*g?\s*Carbs?)?[^\n]*?"
-    r"(?:\|\s*)?(?:(\d+)\s*g?\s*Fat)?",
-    flags=re.IGNORECASE
-)
-
-SERVINGS_PATTERN = re.compile(
-    r"(?:Makes?\s*(\d+)|Serves?\s*(\d+)|Per\s*Serving\s*\(\s*(\d+)\s*Total\))",
-    re.IGNORECASE
-)
-
-SECTION_HEADERS = []
-
-def clean_hashtags(text):
-    text = re.sub(r"(#[A-Za-z0-9_]+)", "", text or "")
-    return re.sub(r"\n\.+\s*$", "", text.strip(), flags=re.MULTILINE)
-
-def extract_servings_and_macros(text):
-    text = text or ""
-
-    # Find a nearby "Macros" context line (same paragraph)
-    # Grab up to the next blank line to keep the numbers
-    macros_block = ""
-    m = re.search(r"(?is)(Macros[^\n]*?)(?:\n|$)(.*?)(?:\n\s*\n|$)", text)
-    if m:
-        # Combine header and next line just in case values are split
-        macros_block = (m.group(1) + " " + (m.group(2) or "")).strip()
-    else:
-        # Fallback: search the whole text
-        macros_block = text
-
-    # Value-first, order-agnostic captures (allow optional 'g' and case variants)
-    cal = None
-    pro = None
-    carb = None
-    fat = None
-
-    m_cal = re.search(r"(\d+)\s*Calories?", macros_block, re.IGNORECASE)
-    if m_cal: cal = int(m_cal.group(1))
-
-    m_pro = re.search(r"(\d+)\s*g?\s*Proteins?", macros_block, re.IGNORECASE) or \
-            re.search(r"Protein\s*[:\-]?\s*(\d+)\s*g?", macros_block, re.IGNORECASE)
-    if m_pro: pro = int(m_pro.group(1))
-
-    m_carb = re.search(r"(\d+)\s*g?\s*Carbs?", macros_block, re.IGNORECASE) or \
-             re.search(r"Carbs?\s*[:\-]?\s*(\d+)\s*g?", macros_block, re.IGNORECASE)
-    if m_carb: carb = int(m_carb.group(1))
-
-    m_fat = re.search(r"(\d+)\s*g?\s*Fat", macros_block, re.IGNORECASE) or \
-            re.search(r"Fat\s*[:\-]?\s*(\d+)\s*g?", macros_block, re.IGNORECASE)
-    if m_fat: fat = int(m_fat.group(1))
-
-    # Servings tolerant variants, including "Ingredients (Makes 5)"
-    servings = None
-    m_serv = SERVINGS_PATTERN.search(text)
-    if not m_serv:
-        m_serv = re.search(r"Ingredients?\s*\(\s*Makes?\s*(\d+)\s*\)", text, re.IGNORECASE)
-    if m_serv:
-        for g in m_serv.groups():
-            if g and g.isdigit():
-                servings = int(g)
-                break
-
-    return servings, {"cal": cal, "protein": pro, "carbs": carb, "fat": fat}
-
-def split_sections_strict(caption):
-    text = clean_hashtags(caption or "")
-
-    blurb = ""
-    head_split = re.split(r"\n\s*\n", text, maxsplit=1)
-    if len(head_split) == 2 and len(head_split[0]) < 220:
-        blurb = head_split[0].strip()
-        text = head_split[1].strip()
-
-    servings, macros = extract_servings_and_macros(text)
-    text = MACRO_PATTERN.sub("", text) if 'MACRO_PATTERN' in globals() else text
-    text = SERVINGS_PATTERN.sub("", text)
-
-    ing_block, instr_block = split_ingredients_and_instructions(text)
-
-    # Detect subsections in ingredients
-    sections = {}
-    found_sub = False
-    for label, pat in SECTION_HEADERS:
-        m = re.search(pat + r"\s*:?", ing_block)
-        if m:
-            found_sub = True
-    if found_sub:
-        # slice by subsections
-        order = []
-        for label, pat in SECTION_HEADERS:
-            m = re.search(pat + r"\s*:?", ing_block)
-            if m:
-                order.append((label, m.start()))
-        order.sort(key=lambda x: x[1])
-        for idx, (label, start) in enumerate(order):
-            end = order[idx+1][1] if idx+1 < len(order) else len(ing_block)
-            sections[label] = ing_block[start:end]
-    else:
-        sections["Ingredients"] = ing_block
-
-    ingredient_groups = {k: parse_ingredient_lines(v) for k, v in sections.items()}
-    instruction_steps = parse_numbered_steps(instr_block)
-    # If no numbered steps were found but we still have an instructions block,
-    # try to heuristically split it by common cooking action verbs so we get
-    # a reasonable list of steps for rendering.
-    if not instruction_steps and instr_block:
-        instruction_steps = split_instructions_by_actions(instr_block)
-
-    # Optional notes line at end
-    notes = ""
-    notes_match = re.search(r"(?i)\bNotes?\b\s*:?\s*(.+)$", text, re.DOTALL)
-    if notes_match:
-        notes = parse_typography(notes_match.group(1))
-
-    return {
-        "blurb": blurb,
-        "servings": servings,
-        "macros": macros,
-        "ingredients": ingredient_groups,
-        "instructions": instruction_steps,
-        "notes": notes
-    }
-
-
-def split_ingredients_and_instructions(text):
-    """
-    Return (ingredients_block, instructions_block)
-    - Recognizes 'Ingredients' and 'Instructions/Directions/Steps' headers
-    - If instructions header missing, uses first line that starts with a number+dot
-      as the beginning of instructions.
-    """
-    t = clean_hashtags(text) or ""
-    # Normalize bullets and whitespace
-    t = t.replace("\r", "")
-
-    # Special-case: "You'll need:" (allow straight or curly apostrophe) where
-    # the header may include ingredients on the same line. If found, return
-    # only the text after that header as the ingredients block.
-    # Allow an optional chef emoji prefix (👩‍🍳) before the header
-    m_you = re.search(r"(?im)^\s*(?:👩‍🍳\s*)?You(?:'|’)?ll need\s*:?\s*(.*)$", t, flags=re.M)
-    if m_you:
-        prefix = (m_you.group(1) or "").strip()
-        rest = t[m_you.end():]
-        # Look for an instructions header following the "You'll need" block
-        m_instr2 = re.search(r"(?im)^\s*(Instructions?|Directions?|Steps?|To\s+make|Method)\s*:?\s*$", rest, flags=re.M)
-        if m_instr2:
-            ing_block = (prefix + "\n" + rest[:m_instr2.start()]).strip()
-            instr_block = rest[m_instr2.end():].strip()
-        else:
-            ing_block = (prefix + "\n" + rest).strip()
-            instr_block = ""
-        return ing_block, instr_block
-
-    # Find the 'Ingredients' header
-    # Match headings like "👩‍🍳 INGREDIENTS" or plain "Ingredients"
-    m_ing = re.search(r"(?im)^\s*(?:👩‍🍳\s*)?Ingredients?\s*:?\s*$", t, flags=re.M)
-    start = m_ing.end() if m_ing else 0
-    after_ing = t[start:].strip()
-
-    # Try to find explicit instructions header (include 'To make')
-    # Recognize '👩‍🍳 DIRECTIONS', 'Directions', 'To make', etc.
-    m_instr = re.search(r"(?im)^\s*(?:👩‍🍳\s*)?(Instructions?|Directions?|Steps?|To\s+make|Method)\s*:?\s*$", after_ing, flags=re.M)
-    if m_instr:
-        ing_block = after_ing[:m_instr.start()].strip()
-        instr_block = after_ing[m_instr.end():].strip()
-        return ing_block, instr_block
-
-    # Fallback: detect first numbered step line as start of instructions
-    m_num = re.search(r"(?m)^\s*\d+\.\s+", after_ing)
-    if m_num:
-        ing_block = after_ing[:m_num.start()].strip()
-        instr_block = after_ing[m_num.start():].strip()
-        return ing_block, instr_block
-
-    # Fallback: if we see bullet-like cooking verbs, split on first 'Cook|Bake|Shred|Mix|Add|Serve'
-    m_verb = re.search(r"(?im)^\s*(Cook|Bake|Shred|Stir|Mix|Add|Serve|Lower|Cover)\b.*", after_ing, flags=re.M)
-    if m_verb:
-        ing_block = after_ing[:m_verb.start()].strip()
-        instr_block = after_ing[m_verb.start():].strip()
-        return ing_block, instr_block
-
-    # No detection, treat all as ingredients
-    return after_ing, ""
-
-def parse_ingredient_lines(block):
-    lines = []
-    for raw in re.split(r"\n+", block):
-        s = raw.strip()
-        if not s:
-            continue
-        # Stop if this is a section header mistakenly in the block
-        # Accept headings like "👩‍🍳 DIRECTIONS" as well
-        if re.match(r"(?i)^(?:👩‍🍳\s*)?(Instructions?|Directions?|Steps?)\s*:?\s*$", s):
-            break
-        # Remove leading bullets/dashes
-        s = re.sub(r"^[•\-\–\*]\s*", "", s)
-        lines.append(parse_typography(s))
-    return lines
-
-def parse_numbered_steps(block):
-    block = (block or "").strip()
-    if not block:
-        return []
-    # First, split when steps are on separate lines starting with 1., 2., etc.
-    lines = re.findall(r"(?m)^\s*\d+\.\s+.*", block)
-    if lines and len(lines) > 1:
-        return [parse_typography(re.sub(r"^\s*\d+\.\s+", "", ln).strip()) for ln in lines]
-
-    # If not found, split inline '1. ... 2. ...' within one paragraph
-    chunks = re.split(r"\s(?=\d+\.\s)", block)  # keep numbers by splitting before them
-    steps = []
-    buf = ""
-    for ch in chunks:
-        if re.match(r"^\d+\.\s", ch):
-            if buf:
-                steps.append(buf.strip())
-            buf = re.sub(r"^\d+\.\s", "", ch)
-        else:
-            buf += " " + ch
-    if buf.strip():
-        steps.append(buf.strip())
-
-    # As a final fallback, split on bullets
-    if len(steps) <= 1:
-        steps = [parse_typography(x) for x in re.split(r"(?:\n[•\-\–]\s+|\s•\s+)", block) if x.strip()]
-
-    # If we still have a single (long) step but the block contains multiple
-    # sentence boundaries, try to split by action verbs / sentences to get
-    # more granular steps (fixes cases where the author didn't number steps).
-    if len(steps) <= 1 and re.search(r"[\.\!\?]\s+", block):
-        # Defer to the action-based splitter which will also fall back to
-        # sentence splitting when appropriate.
-        return split_instructions_by_actions(block)
-
-    return [parse_typography(s) for s in steps if s]
-
-
-def split_instructions_by_actions(block):
-    """Split a free-form instructions block into steps by common cooking actions.
-
-    Heuristic: split on newlines first; if that yields a single long paragraph,
-    split on locations where an action verb starts a sentence/phrase (e.g.
-    "Cook", "Bake", "Mix", "Add", ...). Returns a list of cleaned steps.
+def finish_thumbnail(image_path, as_bytes=False, profile=None):
+    """Round, flatten and encode a downloaded thumbnail for IMAGE_PROFILE."""
+    settings = IMAGE_PROFILES[profile or IMAGE_PROFILE]
+    scale = settings["dpi"] / 72.0
+    return crop_and_effects(image_path, THUMB_RADIUS_RATIO, as_bytes,
+                            max_size=(int(THUMB_BOX_W * scale), int(THUMB_BOX_H * scale)),
+                            matte=THUMB_MATTE, quality=settings["quality"])
+
+def rematte(image, matte, radius_ratio=THUMB_RADIUS_RATIO, quality=None):
+    """A thumbnail flattened onto THUMB_MATTE, flattened onto `matte`
+    instead; returns JPEG bytes. The corner mask is redrawn the way
+    crop_and_effects draws it, so anti-aliased edge pixels are re-blended
+    (pixel + (1 - alpha) * (new - old)) rather than left with a fringe."""
+    from PIL import Image as PILImg, ImageChops, ImageColor, ImageDraw
+
+    with PILImg.open(_image_input(image)) as img:
+        img = img.convert("RGB")
+    w, h = img.size
+    outside = PILImg.new("L", (w, h), 255)
+    ImageDraw.Draw(outside).rounded_rectangle((0, 0, w, h), radius=int(min(w, h) * radius_ratio), fill=0)
+    channels = []
+    for channel, old, new in zip(img.split(), ImageColor.getrgb(THUMB_MATTE), ImageColor.getrgb(matte)):
+        shift = outside.point(lambda a, d=abs(new - old): round(a * d / 255))
+        channels.append(ImageChops.add(channel, shift) if new > old else ImageChops.subtract(channel, shift))
+    buf = io.BytesIO()
+    PILImg.merge("RGB", channels).save(buf, format="JPEG", optimize=True,
+                                       quality=quality or IMAGE_PROFILES[IMAGE_PROFILE]["quality"])
+    return buf.getvalue()
+
+def resize_for_layout(path, max_width, max_height, as_bytes=False, dpi=72):
+    """Downscale the image at `path` to fit max_width x max_height points
+    at `dpi` pixels per inch.
+
+    Returns (path, (w, h)). Images that already fit are returned untouched;
+    otherwise a resized copy is written. With `as_bytes` the copy is
+    returned as PNG bytes instead of a file.
     """
-    if not block:
-        return []
-
-    verbs = [
-        'Cook', 'Bake', 'Shred', 'Stir', 'Mix', 'Add', 'Serve', 'Lower', 'Cover',
-        'Heat', 'Preheat', 'Sear', 'Fry', 'Roast', 'Simmer', 'Whisk', 'Combine',
-        'Fold', 'Blend', 'Divide', 'Chop', 'Slice', 'Dice', 'Boil', 'Reduce',
-        'Drain', 'Bake', 'Broil', 'Toast', 'Marinate'
-    ]
-    verb_pat = r"(?:" + r"|".join(re.escape(v) for v in verbs) + r")\b"
-
-    # First split by explicit newlines and discard tiny lines
-    lines = [ln.strip() for ln in re.split(r"\n+", block) if ln.strip()]
-    if len(lines) > 1:
-        # Clean up lines: remove leading bullets and numbers
-        cleaned = []
-        for ln in lines:
-            ln2 = re.sub(r"^[•\-\–\*\s]*\d+\.?\s*", "", ln).strip()
-            if ln2:
-                cleaned.append(parse_typography(ln2))
-        return cleaned
-
-    # Single paragraph: split by verb-start lookahead (start of string, after
-    # sentence end, or after newline). This captures sequences like
-    # "1. Cook... 2. Mix..." without numbers, or sentences that start with verbs.
-    split_re = re.compile(r"(?im)(?<=^|[\.\!\?]\s|\n)(?=(%s))" % verb_pat)
-    parts = [p.strip() for p in split_re.split(block) if p and p.strip()]
-
-    # The split produces interleaved verb tokens and text; recombine where needed
-    steps = []
-    i = 0
-    while i < len(parts):
-        if re.match(r"(?i)^%s" % verb_pat, parts[i]):
-            # verb token at parts[i], text at parts[i+1] if present
-            verb = parts[i].strip()
-            text = parts[i+1].strip() if i+1 < len(parts) else ""
-            step = (verb + " " + text).strip()
-            steps.append(parse_typography(step))
-            i += 2
-        else:
-            steps.append(parse_typography(parts[i]))
-            i += 1
-
-    # As a final fallback, split on sentence boundaries
-    if not steps:
-        sents = re.split(r"(?<=[\.\!\?])\s+", block)
-        steps = [parse_typography(s.strip()) for s in sents if s.strip()]
-
-    # If we still only have a single long step, try a simpler sentence split
-    # which often breaks up run-on instruction paragraphs (helps cases like
-    # recipe 16 where many sentences were joined into one paragraph).
-    if len(steps) <= 1:
-        sents = re.split(r"(?<=[\.\!\?])\s+", block)
-        sents_clean = [parse_typography(s.strip()) for s in sents if s.strip()]
-        if len(sents_clean) > 1:
-            return sents_clean
-
-    return steps
-
+    from PIL import Image as PILImg
+
+    with PILImg.open(_image_input(path)) as im:
+        w, h = im.size
+
+        # Convert target size from points (1 inch = 72 pt) to pixels
+        target_w = int(max_width * dpi / 72)
+        target_h = int(max_height * dpi / 72)
+
+        # scale to fit inside the box
+        scale = min(target_w / w, target_h / h, 1.0)
+        if scale >= 1.0:
+            return path, (w, h)
+        new_w = int(w * scale)
+        new_h = int(h * scale)
+
+        # physically resize the image
+        im_resized = im.resize((new_w, new_h))
+        if as_bytes or not isinstance(path, str):
+            buf = io.BytesIO()
+            im_resized.save(buf, format="PNG", dpi=(72, 72))
+            return buf.getvalue(), (new_w, new_h)
+        tmp_path = "/tmp/resized_" + os.path.basename(path)
+        # Save with 72 dpi so ReportLab interprets pixels as points
+        try:
+            im_resized.save(tmp_path, dpi=(72, 72))
+        except Exception:
+            im_resized.save(tmp_path)
+    return tmp_path, (new_w, new_h)
 
-# ---- end improved parsing ----
+def two_column_ingredients(items, style, measure=None):
+    from reportlab.platypus import Table, TableStyle
+    from layout_measure import MeasuredParagraph
 
-def two_column_ingredients(items, style):
     n = len(items)
     half = ceil(n/2)
     col1, col2 = items[:half], items[half:]
     while len(col2) < len(col1):
         col2.append("")
-    rows = [[Paragraph(c1, style), Paragraph(c2, style)] for c1, c2 in zip(col1, col2)]
+    rows = [[MeasuredParagraph(c1, style, cache=measure), MeasuredParagraph(c2, style, cache=measure)]
+            for c1, c2 in zip(col1, col2)]
     table = Table(rows, colWidths=[2.15*inch, 2.15*inch])
     table.setStyle(TableStyle([('VALIGN', (0,0), (-1,-1), 'TOP'), ("LEFTPADDING", (0,0), (-1,-1), 6)]))
     return table
 
-def generate_qr_code(url):
+def generate_qr_code(url, as_bytes=False):
+    import qrcode
+
     qr_img = qrcode.make(url)
+    if as_bytes:
+        buf = io.BytesIO()
+        qr_img.save(buf)
+        return buf.getvalue()
     qr_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
     qr_img.save(qr_temp.name)
     return qr_temp.name
 
-def parse_icons(text):
-    servings, time = "", ""
-    servings_match = re.search(r"(serves|portions?)\s*:?[\s]*([0-9]+)", text or "", re.IGNORECASE)
-    time_match = re.search(r"([0-9]+)[\s]*(minutes?|mins?|hr|hours?)", text or "", re.IGNORECASE)
-    if servings_match:
-        servings = servings_match.group(2)
-    if time_match:
-        time = time_match.group(0)
-    return servings, time
-
-def _download_image(url, headers=None, timeout=20):
-    r = requests.get(url, headers=headers or {"User-Agent": "Mozilla/5.0"}, timeout=timeout)
-    r.raise_for_status()
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-    with open(tmp.name, "wb") as f:
-        f.write(r.content)
-    return tmp.name
-
-def fetch_reel_data_with_instaloader(url, loader):
+@lru_cache(maxsize=4096)
+def _qr_runs(url):
+    """Dark modules of the QR code for `url` as (size, ((row, col, w, h), ...)).
+
+    Horizontal runs are merged with identical runs in the rows below, so
+    each tuple is one filled rectangle in module units.
+
+    Memoized in-process and on disk under CACHE_DIR/qr, so repeated URLs
+    and rebuilds skip the encoder entirely.
+    """
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, "qr", digest + ".json")
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("url") == url:
+            return cached["size"], tuple(tuple(r) for r in cached["runs"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Same settings qrcode.make() uses, so both modes scan identically
+    import qrcode
+
+    qr = qrcode.QRCode(border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    runs = []
+    open_runs = {}  # (col, width) -> index into runs, for runs touching the previous row
+    for y, row in enumerate(matrix):
+        still_open = {}
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                idx = open_runs.get((start, x - start))
+                if idx is None:
+                    idx = len(runs)
+                    runs.append([y, start, x - start, 0])
+                runs[idx][3] += 1
+                still_open[(start, x - start)] = idx
+            else:
+                x += 1
+        open_runs = still_open
+    runs = [tuple(r) for r in runs]
+    size = len(matrix)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "size": size, "runs": runs}, f)
+    except OSError:
+        pass
+    return size, tuple(runs)
+
+# Per-stage timings for this run; see stage_timing.StageTimer
+TIMINGS = StageTimer()
+
+def _timed_qr_runs(url):
+    with TIMINGS.span("qr"):
+        return _qr_runs(url)
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+def _get_downloader():
+    global _downloader
+    from http_download import Downloader
+
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader(os.path.join(CACHE_DIR, "downloads"),
+                                     per_host=DOWNLOAD_CONNECTIONS_PER_HOST,
+                                     retries=DOWNLOAD_RETRIES,
+                                     max_bytes=DOWNLOAD_CACHE_MAX_MB * 1024 * 1024)
+    return _downloader
+
+def _download_image(url, headers=None, timeout=20, key=None, as_bytes=False):
+    # Returns a path inside the download cache; callers must not delete it,
+    # the stored ETag/Last-Modified points at that copy.
+    if as_bytes:
+        return _get_downloader().fetch_bytes(url, key=key, headers=headers, timeout=timeout)
+    return _get_downloader().fetch(url, key=key, headers=headers, timeout=timeout)
+
+def _limited(limiter, fn, *args, **kwargs):
+    # Every request to Instagram goes through here so the limiter sees
+    # throttling responses and can back off for all workers at once.
+    if limiter:
+        return limiter.call(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+def _fetch_post_meta(code, loader, limiter=None, meta_cache=None):
+    import instaloader
+
+    with TIMINGS.span("fetch_meta", code):
+        post = _limited(limiter, instaloader.Post.from_shortcode, loader.context, code)
+    raw_title = getattr(post, "title", None) or (post.caption or "")
+    title = clean_title((raw_title.split("\n")[0] if raw_title else "") or "Untitled Recipe")
+    caption = post.caption or ""
+    meta = {"title": title, "caption": caption, "thumbnail_url": post.url}
+    if meta_cache:
+        meta = meta_cache.put(code, title, caption, post.url)
+    return meta
+
+def _thumbnail_cache_key(image_store, code):
+    # Shortcodes are stable while CDN URLs are re-signed, so key on the code
+    return image_store.key(code, radius_ratio=THUMB_RADIUS_RATIO, effects=THUMB_EFFECTS_VERSION,
+                           profile=IMAGE_PROFILES[IMAGE_PROFILE], matte=THUMB_MATTE)
+
+def fetch_reel_data_with_instaloader(url, loader, limiter=None, meta_cache=None, image_store=None,
+                                     defer_effects=False, in_memory=False, manifest=None):
+    import requests
+
     url = (url or "").strip()
     if not url:
         return None
@@ -631,165 +641,282 @@ def fetch_reel_data_with_instaloader(url, loader):
         print(f"⚠️ Could not parse shortcode from URL: {url}")
         return None
     try:
-        post = instaloader.Post.from_shortcode(loader.context, code)
-        raw_title = getattr(post, "title", None) or (post.caption or "")
-        title = clean_title((raw_title.split("\n")[0] if raw_title else "") or "Untitled Recipe")
-        caption = post.caption or ""
-        thumb_url = post.url
-        thumb_tmp_path = _download_image(thumb_url)
-        refined_thumb_path = crop_and_effects(thumb_tmp_path)
-        try:
-            os.remove(thumb_tmp_path)
-        except Exception:
-            pass
+        meta = meta_cache.get(code) if meta_cache else None
+        from_cache = meta is not None
+        if not from_cache:
+            meta = _fetch_post_meta(code, loader, limiter, meta_cache)
+
+        image_key = _thumbnail_cache_key(image_store, code) if image_store else None
+        refined_thumb_path = image_store.get(image_key) if image_store else None
+        if refined_thumb_path and in_memory:
+            with open(refined_thumb_path, "rb") as f:
+                refined_thumb_path = f.read()
+        if not refined_thumb_path:
+            try:
+                with TIMINGS.span("download", code):
+                    thumb_path = _limited(limiter, _download_image, meta["thumbnail_url"], key=code,
+                                          as_bytes=in_memory)
+            except requests.HTTPError as e:
+                # throttling already went through the limiter; only a dead
+                # link is worth a fresh lookup
+                if not from_cache or classify_error(e) is not None:
+                    raise
+                # Instagram CDN links are signed and expire, so a cached URL can
+                # go stale long before the caption does. Refresh it once, and
+                # drop the stale entry first so a failed refresh isn't retried
+                # with the dead link next run.
+                meta_cache.invalidate(code)
+                meta = _fetch_post_meta(code, loader, limiter, meta_cache)
+                with TIMINGS.span("download", code):
+                    thumb_path = _limited(limiter, _download_image, meta["thumbnail_url"], key=code,
+                                          as_bytes=in_memory)
+            if defer_effects:
+                # crop_and_effects runs later, in prepare_images' process pool
+                if manifest:
+                    manifest.advance(code, "fetched")
+                return {
+                    "title": meta["title"],
+                    "caption": (meta["caption"] or "").strip(),
+                    "url": url,
+                    "shortcode": code,
+                    "thumbnail": None,
+                    "thumbnail_raw": thumb_path,
+                    "thumbnail_key": image_key,
+                }
+            with TIMINGS.span("effects", code):
+                refined_thumb_path = finish_thumbnail(thumb_path, as_bytes=in_memory)
+            if image_store and in_memory:
+                image_store.put_bytes(image_key, refined_thumb_path)
+            elif image_store:
+                refined_thumb_path = image_store.put(image_key, refined_thumb_path)
+        if manifest:
+            manifest.advance(code, "image-ready")
         return {
-            "title": title,
-            "caption": caption.strip(),
+            "title": meta["title"],
+            "caption": (meta["caption"] or "").strip(),
             "url": url,
+            "shortcode": code,
             "thumbnail": refined_thumb_path
         }
     except Exception as e:
         print(f"⚠️ Failed to fetch {url}: {e}")
+        if manifest:
+            manifest.fail(code, f"fetch: {e}")
         return None
 
-def create_pdf(recipes):
-    page_width, page_height = LETTER
+def _windowed(submit, items, window):
+    """Call `submit` for each item, keeping at most `window` submissions
+    outstanding; yields what `submit` returned, in input order."""
+    pending = deque()
+    for item in items:
+        pending.append(submit(item))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+def iter_reels(urls, loader, workers=FETCH_WORKERS, limiter=None, meta_cache=None, image_store=None,
+               defer_effects=False, in_memory=False, window=None, manifest=None, sessions=None):
+    """Fetch reels with up to `workers` in flight, yielding recipes in the
+    order of `urls` (failed fetches are dropped).
+
+    `urls` may be any iterable; at most `window` (default 2 x workers)
+    finished recipes are held waiting for the consumer, so a long URL list
+    is never fetched into memory all at once. Progress is recorded in
+    `manifest` (a RunManifest) when given. With `sessions` (a SessionPool)
+    each reel is fetched through whichever session `sessions.pick()` hands
+    out, instead of `loader` and `limiter`.
+    """
+    def fetch_one(u):
+        if sessions:
+            _name, session_loader, session_limiter = sessions.pick()
+        else:
+            session_loader, session_limiter = loader, limiter
+        return fetch_reel_data_with_instaloader(u, session_loader, session_limiter, meta_cache,
+                                                image_store, defer_effects, in_memory, manifest)
 
-    if DEBUG_LAYOUT:
-        for idx, recipe in enumerate(recipes, 1):
-            parsed = split_sections_strict(recipe.get('caption', ''))
-            print(f"\n--- Recipe {idx}: {recipe.get('title')} ---")
-            print("Ingredients groups:")
-            for g, items in parsed.get('ingredients', {}).items():
-                print(f"  [{g}]")
-                for it in items:
-                    print(f"    - {it}")
-            print("Instructions:")
-            for i, s in enumerate(parsed.get('instructions', []), 1):
-                print(f"  {i}. {s}")
-        print("\nDEBUG_LAYOUT enabled — skipping PDF build.")
+    if workers <= 1:
+        yield from filter(None, map(fetch_one, urls))
         return
-
-    if DEBUG_DIAGNOSTICS:
-        # Run a measurement-only pass and print compact diagnostics per recipe
-        page_width, page_height = LETTER
-        frame_w = page_width - (0.75*inch + 0.75*inch)
-        frame_h = page_height - (0.75*inch + 0.75*inch)
-        left_col_w = 3.7*inch
-        cell_pad_left = 18
-        cell_pad_right = 18
-        col2_outer_w = frame_w - left_col_w
-        right_col_inner_w = col2_outer_w - (cell_pad_left + cell_pad_right)
-        page_avail_h = page_height - (0.75*inch + 0.75*inch)
-
-        def _diag_image_dims(path, max_width=3.7*inch, max_height=6.0*inch):
-            if not path or not os.path.exists(path):
-                return (max_width * 0.5, max_height * 0.5)
-            try:
-                with PILImg.open(path) as im:
-                    w, h = im.size
-                    target_w = int(max_width)
-                    target_h = int(max_height)
-                    scale = min(target_w / w, target_h / h, 1.0)
-                    new_w = int(w * scale)
-                    new_h = int(h * scale)
-                    # treat pixels as points (image saved at 72dpi)
-                    return float(new_w), float(new_h)
-            except Exception:
-                return (max_width, max_height)
-
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = _windowed(lambda u: pool.submit(fetch_one, u), urls, window or 2 * workers)
+        for future in futures:
+            r = future.result()
+            if r:
+                yield r
+
+def fetch_reels(urls, loader, workers=FETCH_WORKERS, limiter=None, meta_cache=None, image_store=None,
+                defer_effects=False, in_memory=False, manifest=None, sessions=None):
+    """Fetch every URL with up to `workers` reels in flight.
+
+    All workers share `limiter` (or the per-session limiters of `sessions`),
+    so the combined request rate stays under its ceiling. Recipes come back
+    in the same order as `urls` (failed fetches are dropped) so the PDF is
+    identical run to run.
+    """
+    urls = list(urls)
+    return list(iter_reels(urls, loader, workers, limiter, meta_cache, image_store,
+                           defer_effects, in_memory, window=len(urls) or 1, manifest=manifest,
+                           sessions=sessions))
+
+def _prepare_image_job(job):
+    """Worker for prepare_images(); must stay top-level so it pickles."""
+    raw_path, thumb_path, qr_url, as_bytes, profile = job
+    timings = {}
+    source_bytes = _byte_size(raw_path)
+    t0 = time.perf_counter()
+    if raw_path:
+        thumb_path = finish_thumbnail(raw_path, as_bytes, profile)
+        t1 = time.perf_counter()
+        timings["effects"] = t1 - t0
+        t0 = t1
+    layout_path = None
+    if thumb_path:
+        layout_path, _size = resize_for_layout(thumb_path, THUMB_BOX_W, THUMB_BOX_H, as_bytes,
+                                               dpi=IMAGE_PROFILES[profile]["dpi"])
+        t1 = time.perf_counter()
+        timings["resize"] = t1 - t0
+        t0 = t1
+    qr_layout = None
+    if qr_url:
+        qr_layout, _size = resize_for_layout(generate_qr_code(qr_url, as_bytes), QR_BOX, QR_BOX, as_bytes)
+        timings["qr"] = time.perf_counter() - t0
+    return thumb_path, layout_path, qr_layout, timings, (source_bytes, _byte_size(layout_path))
+
+def _byte_size(src):
+    if isinstance(src, (bytes, bytearray)):
+        return len(src)
+    try:
+        return os.path.getsize(src) if src else 0
+    except OSError:
+        return 0
+
+def _kb(n):
+    return f"{n / 1024:.0f} KB"
+
+def _image_job(recipe, in_memory):
+    # vector QR codes are drawn at build time and need no preparation
+    qr_url = None if QR_MODE == "vector" else recipe.get("url")
+    return recipe.get("thumbnail_raw"), recipe.get("thumbnail"), qr_url, in_memory, IMAGE_PROFILE
+
+def _apply_prepared(idx, recipe, result, image_store):
+    """Store one _prepare_image_job() result on its recipe; returns
+    (CPU seconds, source bytes, embedded bytes)."""
+    thumb, layout, qr_layout, timings, (source_bytes, embedded_bytes) = result
+    key = recipe.pop("thumbnail_key", None)
+    recipe.pop("thumbnail_raw", None)
+    if thumb and key and image_store and thumb is not recipe.get("thumbnail"):
+        if isinstance(thumb, bytes):
+            image_store.put_bytes(key, thumb)
+        else:
+            stored = image_store.put(key, thumb)
+            if layout == thumb:
+                layout = stored
+            thumb = stored
+    recipe["thumbnail"] = thumb
+    recipe["thumbnail_layout"] = layout
+    recipe["qr_layout"] = qr_layout
+    for stage, seconds in timings.items():
+        TIMINGS.record(stage, seconds, recipe.get("shortcode"))
+    parts = ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in timings.items())
+    if source_bytes:
+        change = embedded_bytes / source_bytes - 1
+        parts += f" | {_kb(source_bytes)} -> {_kb(embedded_bytes)} ({change:+.0%})"
+    elif embedded_bytes:
+        parts += f" | {_kb(embedded_bytes)} (cached)"
+    print(f"🖼️ [{idx}] {recipe.get('title', 'Untitled')}: {parts}")
+    return sum(timings.values()), source_bytes, embedded_bytes
+
+def prepare_images(recipes, image_store=None, workers=IMAGE_WORKERS, in_memory=False):
+    """Produce layout-ready thumbnails and QR codes before the PDF build.
+
+    Runs crop_and_effects (for reels fetched with defer_effects=True), the
+    layout resize and QR rendering in a process pool, then stores the
+    results on each recipe as `thumbnail`, `thumbnail_layout` and
+    `qr_layout` (paths, or bytes when `in_memory`). Prints per-image timings.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs = [_image_job(r, in_memory) for r in recipes]
+    if not jobs:
+        return recipes
+    started = time.perf_counter()
+    if workers <= 1 or len(jobs) == 1:
+        results = [_prepare_image_job(j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_prepare_image_job, jobs))
+    wall = time.perf_counter() - started
+
+    busy = source_total = embedded_total = 0
+    for idx, (recipe, result) in enumerate(zip(recipes, results), 1):
+        cpu, source_bytes, embedded_bytes = _apply_prepared(idx, recipe, result, image_store)
+        busy += cpu
+        source_total += source_bytes
+        embedded_total += embedded_bytes
+    print(f"🖼️ Prepared {len(jobs)} images in {wall:.2f}s wall ({busy:.2f}s CPU across {max(1, workers)} workers)")
+    print(f"🖼️ Image bytes ({IMAGE_PROFILE} profile): {_kb(source_total)} downloaded -> {_kb(embedded_total)} embedded")
+    return recipes
+
+def iter_prepared(recipes, image_store=None, workers=IMAGE_WORKERS, in_memory=False, window=None):
+    """Streaming prepare_images(): consume recipes from any iterable and
+    yield each one once its images are ready, in input order, with at most
+    `window` (default 2 x workers) recipes in the pool at a time."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers <= 1:
         for idx, recipe in enumerate(recipes, 1):
-            caption = recipe.get('caption', '')
-            parsed = split_sections_strict(caption)
-
-            # build a representative right_col similar to the main flow
-            right_col = []
-            right_col.append(Paragraph(recipe.get('title', ''), getSampleStyleSheet()['Title']))
-            # ingredients
-            right_col.append(Paragraph('Ingredients', getSampleStyleSheet()['Normal']))
-            ingredient_groups = parsed.get('ingredients', {'Ingredients': []})
-            multi_groups = len(ingredient_groups) > 1
-            for grp, items in ingredient_groups.items():
-                if multi_groups:
-                    right_col.append(Paragraph(grp, getSampleStyleSheet()['Normal']))
-                if items:
-                    if len(items) > 10:
-                        right_col.append(two_column_ingredients(items, getSampleStyleSheet()['Normal']))
-                    else:
-                        for it in items:
-                            right_col.append(Paragraph(it, getSampleStyleSheet()['Normal']))
-            right_col.append(Paragraph('Instructions', getSampleStyleSheet()['Normal']))
-            for i, step in enumerate(parsed.get('instructions', []), 1):
-                right_col.append(Paragraph(f"{i}. {step}", getSampleStyleSheet()['Normal']))
-
-            # Image metrics (diagnostic approximation using PIL)
-            img_w, img_h = _diag_image_dims(recipe.get('thumbnail'))
-
-            # measure right column
-            right_measures = []
-            total_right_h = 0.0
-            for flow in right_col:
-                try:
-                    w, h = flow.wrap(right_col_inner_w, page_avail_h)
-                except Exception:
-                    h = 14 * max(1, (len(getattr(flow, 'text', '') or '').splitlines()))
-                    w = right_col_inner_w
-                right_measures.append((flow, w, h))
-                total_right_h += h
+            _apply_prepared(idx, recipe, _prepare_image_job(_image_job(recipe, in_memory)), image_store)
+            yield recipe
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(recipe):
+            return recipe, pool.submit(_prepare_image_job, _image_job(recipe, in_memory))
 
-            max_single_h = max((h for (_f, _w, h) in right_measures), default=0.0)
+        for idx, (recipe, future) in enumerate(_windowed(submit, recipes, window or 2 * workers), 1):
+            _apply_prepared(idx, recipe, future.result(), image_store)
+            yield recipe
 
-            table_vertical_padding = 16 + 16
-            safety_margin = 6
-            allowed_row_h = page_avail_h - table_vertical_padding - safety_margin
 
-            # conservative re-measure
-            extra_margin = 8
-            conservative_w = max(1.0, right_col_inner_w - extra_margin)
-            conservative_total = 0.0
-            for f in right_col:
-                try:
-                    _w, _h = f.wrap(conservative_w, page_avail_h)
-                except Exception:
-                    _h = 14 * max(1, (len(getattr(f, 'text', '') or '').splitlines()))
-                conservative_total += _h
+def parse_recipes(recipes, manifest=None):
+    """Parse each caption into `sections` ahead of layout, dropping (and
+    recording) recipes whose caption can't be parsed. Recipes that already
+    carry `sections` (e.g. from the library) pass through as they are."""
+    for recipe in recipes:
+        code = recipe.get("shortcode")
+        try:
+            if recipe.get("sections") is None:
+                with TIMINGS.span("parse", code):
+                    recipe["sections"] = split_sections_strict(recipe.get("caption", ""))
+        except Exception as e:
+            print(f"⚠️ Could not parse caption of {recipe.get('url')}: {e}")
+            if manifest and code:
+                manifest.fail(code, f"parse: {e}")
+            continue
+        if manifest and code:
+            manifest.advance(code, "parsed")
+        yield recipe
 
-            # compute top-slice k
-            prefix_h = 0.0
-            k = 0
-            for (_flow, _w, h) in right_measures:
-                if prefix_h + h > allowed_row_h:
-                    break
-                prefix_h += h
-                k += 1
+def _mark(recipes, manifest, state):
+    for recipe in recipes:
+        if manifest and recipe.get("shortcode"):
+            manifest.advance(recipe["shortcode"], state)
+        yield recipe
 
-            conservative_top = 0.0
-            if k > 0:
-                for f in [fm[0] for fm in right_measures[:k]]:
-                    try:
-                        _w, _h = f.wrap(conservative_w, page_avail_h)
-                    except Exception:
-                        _h = 14 * max(1, (len(getattr(f, 'text', '') or '').splitlines()))
-                    conservative_top += _h
-
-            # decide
-            if max(img_h, conservative_total) <= allowed_row_h and max_single_h <= allowed_row_h:
-                decision = 'full-side-by-side'
-            elif k > 0 and max(img_h, conservative_top) <= allowed_row_h:
-                decision = f'top-slice(k={k})'
-            else:
-                decision = 'stack'
+def _binary_streams():
+    # Store image and page streams as binary instead of ASCII85 text, which
+    # adds a quarter to the size of every embedded JPEG.
+    from reportlab import rl_config
 
-            # print compact diagnostics
-            print(f"[{idx}] {recipe.get('title','Untitled')}")
-            print(f"    img={img_w:.1f}x{img_h:.1f} pts | right_total={total_right_h:.1f} pts | max_single={max_single_h:.1f} pts | allowed_row_h={allowed_row_h:.1f} pts")
-            print(f"    conservative_total={conservative_total:.1f} pts | k={k} | conservative_top={conservative_top:.1f} pts | decision={decision}")
+    rl_config.useA85 = 0
 
-        print("\nDEBUG_DIAGNOSTICS complete — no PDF built.")
-        return
+def new_doc(path):
+    """A SimpleDocTemplate with the cookbook's page size and margins."""
+    from reportlab.platypus import SimpleDocTemplate
 
-    doc = SimpleDocTemplate(
-        OUTPUT_PDF,
+    _binary_streams()
+    return SimpleDocTemplate(
+        path,
         pagesize=LETTER,
         leftMargin=0.75 * inch,
         rightMargin=0.75 * inch,
@@ -797,6 +924,10 @@ def create_pdf(recipes):
         bottomMargin=0.75 * inch,
     )
 
+def cookbook_styles():
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(name="TitleWarm", fontName="Helvetica-Bold",
                               fontSize=18, textColor=colors.HexColor("#4B2E05"),
@@ -810,243 +941,313 @@ def create_pdf(recipes):
     styles.add(ParagraphStyle(name="NumberedWarm", fontName="Helvetica",
                               fontSize=10, textColor=colors.HexColor("#3B2B1C"),
                               leading=15, leftIndent=12))
+    return styles
 
-    def background(canvas, doc):
-        canvas.saveState()
-        canvas.setFillColor(colors.HexColor("#FDF8F0"))
-        canvas.rect(0, 0, page_width, page_height, fill=True, stroke=False)
-        canvas.restoreState()
-
-    def footer(canvas, doc):
-        canvas.saveState()
-        canvas.setFont("Helvetica", 9)
-        canvas.setFillColor(colors.HexColor("#8B6B3A"))
-        canvas.drawRightString(page_width - inch, 0.5 * inch, f"Page {doc.page}")
-        canvas.restoreState()
-
-    def safe_image(path, max_width=3.7*inch, max_height=6.0*inch):
-        """Return a ReportLab Image flowable scaled to fit within PDF frame,
-        by actually resizing the image file before ReportLab loads it."""
-        if not path or not os.path.exists(path):
-            return Spacer(max_width, max_height * 0.5)
 
-        try:
-            with PILImg.open(path) as im:
-                w, h = im.size
-                aspect = h / float(w)
+def background(canvas, doc):
+    from reportlab.lib import colors
 
-                # Convert target size from points (1 inch = 72 pt)
-                # to pixels, assuming 72 dpi output so 1 pt = 1 px
-                target_w = int(max_width)
-                target_h = int(max_height)
+    page_width, page_height = LETTER
+    canvas.saveState()
+    canvas.setFillColor(colors.HexColor(PAGE_BACKGROUND))
+    canvas.rect(0, 0, page_width, page_height, fill=True, stroke=False)
+    canvas.restoreState()
 
-                # scale to fit inside the box
-                scale = min(target_w / w, target_h / h, 1.0)
-                new_w = int(w * scale)
-                new_h = int(h * scale)
+def footer(canvas, page):
+    from reportlab.lib import colors
 
-                # physically resize the image
-                im_resized = im.resize((new_w, new_h))
-                tmp_path = "/tmp/resized_" + os.path.basename(path)
-                # Save with 72 dpi so ReportLab interprets pixels as points
-                try:
-                    im_resized.save(tmp_path, dpi=(72, 72))
-                except Exception:
-                    im_resized.save(tmp_path)
+    page_width, _page_height = LETTER
+    canvas.saveState()
+    canvas.setFont("Helvetica", 9)
+    canvas.setFillColor(colors.HexColor("#8B6B3A"))
+    canvas.drawRightString(page_width - inch, 0.5 * inch, f"Page {page}")
+    canvas.restoreState()
 
-            # Now create an Image flowable without forcing pixel sizes; ask
-            # ReportLab to restrict it to the requested max dimensions so
-            # drawWidth/drawHeight are set in points.
-            img = Image(tmp_path)
-            try:
-                img._restrictSize(max_width, max_height)
-            except Exception:
-                # Fallback: set explicit sizes based on our resize
-                img.drawWidth = min(new_w, int(max_width))
-                img.drawHeight = min(new_h, int(max_height))
-            img.hAlign = "CENTER"
-            return img
+def decorate_page(canvas, doc):
+    background(canvas, doc)
+    footer(canvas, doc.page)
 
-        except Exception as e:
-            print(f"⚠️ Skipping bad image {path}: {e}")
-            return Spacer(max_width, max_height * 0.5)
+def safe_image(path, max_width=3.7*inch, max_height=6.0*inch, dpi=72):
+    """Return a ReportLab Image flowable scaled to fit within PDF frame,
+    by actually resizing the image file before ReportLab loads it."""
+    from reportlab.platypus import Image, Spacer
 
-    story = []
+    if not path or (isinstance(path, str) and not os.path.exists(path)):
+        return Spacer(max_width, max_height * 0.5)
 
-    # Small helper flowable that reports a fixed wrap size and draws the
-    # image at that exact size. Using this prevents ReportLab/Table from
-    # later re-interpreting pixel/DPI metadata and accidentally resizing
-    # the image during table layout (which caused the LayoutError).
-    class FixedImage(Flowable):
-        def __init__(self, path, width, height, hAlign="CENTER"):
-            super().__init__()
-            self.path = path
-            self._w = float(width)
-            self._h = float(height)
-            self.hAlign = hAlign
-            try:
-                self.reader = ImageReader(path) if path else None
-            except Exception:
-                self.reader = None
+    try:
+        # No-op for images already sized by prepare_images()
+        tmp_path, (new_w, new_h) = resize_for_layout(path, max_width, max_height, dpi=dpi)
+
+        # Now create an Image flowable without forcing pixel sizes; ask
+        # ReportLab to restrict it to the requested max dimensions so
+        # drawWidth/drawHeight are set in points.
+        img = Image(_image_input(tmp_path))
+        # Image.filename is only a repr() for in-memory buffers, so keep
+        # the real source around for FixedImage
+        img.source = tmp_path
+        try:
+            img._restrictSize(max_width, max_height)
+        except Exception:
+            # Fallback: set explicit sizes based on our resize
+            img.drawWidth = min(new_w, int(max_width))
+            img.drawHeight = min(new_h, int(max_height))
+        img.hAlign = "CENTER"
+        return img
 
-        def wrap(self, availWidth, availHeight):
-            return self._w, self._h
+    except Exception as e:
+        print(f"⚠️ Skipping bad image {_image_label(path)}: {e}")
+        return Spacer(max_width, max_height * 0.5)
 
-        def draw(self):
-            if not self.reader:
-                return
-            # draw at origin; callers control alignment via Table cell paddings
-            self.canv.drawImage(self.reader, 0, 0, width=self._w, height=self._h,
-                                preserveAspectRatio=True, anchor='sw')
+class LazyStory(list):
+    """A story list that lays out recipes one at a time.
 
+    `doc.build()` only ever looks at the front of the story (checking
+    `len()`, then popping or re-inserting split parts), so this list stays
+    short and pulls the next recipe's flowables from `recipe_flows` only
+    once it runs empty. Recipes can therefore come from a generator and
+    are freed as soon as they are drawn.
+    """
 
-    for recipe in recipes:
-        # we'll create and size the thumbnail after computing column widths
-        img = None
+    def __init__(self, recipe_flows):
+        super().__init__()
+        self._pending = iter(recipe_flows)
 
-        # Build the right column with title + ingredients + QR. Do NOT add
-        # instructions here — instructions will be appended below the
-        # image+ingredients block across the full page width.
-        right_col = []
-        right_col.append(Paragraph(recipe["title"], styles["TitleWarm"]))
-        right_col.append(Spacer(1, 6))
-        right_col.append(HRFlowable(width="100%", color=colors.HexColor("#E0C9A6"), thickness=1))
-        right_col.append(Spacer(1, 10))
+    def __len__(self):
+        while not super().__len__():
+            chunk = next(self._pending, None)
+            if chunk is None:
+                return 0
+            self.extend(chunk)
+        return super().__len__()
 
-        # Ingredients (use improved parser that strips hashtags)
-        caption = recipe.get("caption", "")
-        parsed = split_sections_strict(caption)
 
-        right_col.append(Paragraph("Ingredients", styles["Section"]))
-        ingredient_groups = parsed.get("ingredients", {"Ingredients": []})
-        multi_groups = len(ingredient_groups) > 1
-        for grp, items in ingredient_groups.items():
-            if multi_groups:
-                # group header
-                right_col.append(Paragraph(grp, styles["Section"]))
-            if items:
-                if len(items) > 10:
-                    right_col.append(two_column_ingredients(items, styles["BodyWarm"]))
-                else:
-                    for it in items:
-                        right_col.append(Paragraph(it, styles["BodyWarm"]))
-        right_col.append(Spacer(1, 10))
-
-        # QR bottom-right
-        qr_path = generate_qr_code(recipe["url"])
-        qr_img = safe_image(qr_path, 1.1*inch, 1.1*inch)
-        qr_img.hAlign = "RIGHT"
-        right_col.append(Spacer(1, 10))
-        right_col.append(qr_img)
-
-        # Capture instructions separately so we can render them full-width
-        instructions = parsed.get("instructions", [])
-        instr_flow = []
-        if instructions:
-            instr_flow.append(Spacer(1, 6))
-            instr_flow.append(Paragraph("Instructions", styles["Section"]))
-            for i, step in enumerate(instructions, 1):
-                instr_flow.append(Paragraph(f"{i}. {step}", styles["NumberedWarm"]))
-
-        # layout: try to keep image side-by-side. If the right column is too
-        # tall, take a top slice that fits next to the image and spill the
-        # remainder below the table; otherwise stack image above content.
-        frame_w = page_width - (0.75*inch + 0.75*inch)
-        # paddings used in the table style
-        cell_pad_left = 9
-        cell_pad_right = 9
-        # make the thumbnail smaller so text wraps sooner and fits side-by-side
-        left_col_w = 3.0*inch
-        col2_outer_w = frame_w - left_col_w
-        # inner width available to flowables inside the right column
-        right_col_inner_w = col2_outer_w - (cell_pad_left + cell_pad_right)
-        page_avail_h = page_height - (0.75*inch + 0.75*inch)
-
-        # create the thumbnail using the actual left column width so it
-        # doesn't dominate the page. Limit its height to ~60% of page
-        # available height so it can sit beside ingredients.
-        try:
-            img = safe_image(recipe.get("thumbnail"), max_width=left_col_w, max_height=page_avail_h * 0.6)
-            # extra safety: cap using left_col_w and page_avail_h
-            cur_w = float(getattr(img, 'drawWidth', getattr(img, 'imageWidth', left_col_w)))
-            cur_h = float(getattr(img, 'drawHeight', getattr(img, 'imageHeight', page_avail_h * 0.6)))
-            max_w = min(left_col_w, frame_w * 0.95)
-            max_h = min(page_avail_h * 0.6, page_avail_h * 0.95)
-            s_w = max_w / cur_w if cur_w > 0 else 1.0
-            s_h = max_h / cur_h if cur_h > 0 else 1.0
-            s = min(1.0, s_w, s_h)
-            if s < 1.0:
-                img.drawWidth = cur_w * s
-                img.drawHeight = cur_h * s
-        except Exception:
-            img = safe_image(recipe.get("thumbnail"))
-        try:
-            img._restrictSize(left_col_w, page_avail_h * 0.95)
-        except Exception:
-            pass
-        img.hAlign = "CENTER"
+def recipe_flowables(recipe, styles, measure=None):
+    """Flowables for one recipe: thumbnail + ingredients block, then steps."""
+    from reportlab.lib import colors
+    from reportlab.platypus import HRFlowable, Spacer, Table
+    from layout_measure import MeasuredParagraph
+    from pdf_flowables import FixedImage, QRCodeFlowable
 
-        # measure right column flowables
-        right_measures = []
-        total_right_h = 0.0
-        for flow in right_col:
-            try:
-                # use the inner content width (subtracting left/right paddings)
-                w, h = flow.wrap(right_col_inner_w, page_avail_h)
-            except Exception:
-                h = 14 * max(1, (len(getattr(flow, 'text', '') or '').splitlines()))
-                w = right_col_inner_w
-            right_measures.append((flow, w, h))
-            total_right_h += h
+    page_width, page_height = LETTER
+    story = []
 
-        # If any single flowable is already taller than the allowed row height
-        # then side-by-side will never work for this recipe; prefer stacking.
-        max_single_h = max((h for (_f, _w, h) in right_measures), default=0.0)
+    def para(text, style):
+        return MeasuredParagraph(text, style, cache=measure)
+
+    # we'll create and size the thumbnail after computing column widths
+    img = None
+
+    # Build the right column with title + ingredients + QR. Do NOT add
+    # instructions here — instructions will be appended below the
+    # image+ingredients block across the full page width.
+    right_col = []
+    right_col.append(para(recipe["title"], styles["TitleWarm"]))
+    right_col.append(Spacer(1, 6))
+    right_col.append(HRFlowable(width="100%", color=colors.HexColor("#E0C9A6"), thickness=1))
+    right_col.append(Spacer(1, 10))
+
+    # Ingredients (use improved parser that strips hashtags)
+    caption = recipe.get("caption", "")
+    parsed = recipe.get("sections") or split_sections_strict(caption)
+
+    right_col.append(para("Ingredients", styles["Section"]))
+    ingredient_groups = parsed.get("ingredients", {"Ingredients": []})
+    multi_groups = len(ingredient_groups) > 1
+    for grp, items in ingredient_groups.items():
+        if multi_groups:
+            # group header
+            right_col.append(para(grp, styles["Section"]))
+        if items:
+            if len(items) > 10:
+                right_col.append(two_column_ingredients(items, styles["BodyWarm"], measure))
+            else:
+                for it in items:
+                    right_col.append(para(it, styles["BodyWarm"]))
+    right_col.append(Spacer(1, 10))
 
-        img_h = float(getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
-        # Account for table paddings when deciding if a single table row
-        # containing the image and the right column will fit on the page.
-        # Our table style uses TOPPADDING/BOTTOMPADDING = 16 each (see below),
-        # so subtract those paddings (and a tiny safety margin) from the
-        # available page height when comparing.
-        table_vertical_padding = 16 + 16
-        # increase safety margin to avoid near-miss LayoutErrors seen in the wild
-        safety_margin = 14
-        allowed_row_h = page_avail_h - table_vertical_padding - safety_margin
+    # QR bottom-right
+    if QR_MODE == "vector":
+        qr_img = QRCodeFlowable(recipe["url"], QR_BOX, _timed_qr_runs)
+    else:
+        qr_path = recipe.get("qr_layout") or generate_qr_code(recipe["url"], IN_MEMORY_IMAGES)
+        qr_img = safe_image(qr_path, QR_BOX, QR_BOX)
+    qr_img.hAlign = "RIGHT"
+    right_col.append(Spacer(1, 10))
+    right_col.append(qr_img)
+
+    # Capture instructions separately so we can render them full-width
+    instructions = parsed.get("instructions", [])
+    instr_flow = []
+    if instructions:
+        instr_flow.append(Spacer(1, 6))
+        instr_flow.append(para("Instructions", styles["Section"]))
+        for i, step in enumerate(instructions, 1):
+            instr_flow.append(para(f"{i}. {step}", styles["NumberedWarm"]))
+
+    # layout: try to keep image side-by-side. If the right column is too
+    # tall, take a top slice that fits next to the image and spill the
+    # remainder below the table; otherwise stack image above content.
+    frame_w = page_width - (0.75*inch + 0.75*inch)
+    # paddings used in the table style
+    cell_pad_left = 9
+    cell_pad_right = 9
+    # make the thumbnail smaller so text wraps sooner and fits side-by-side
+    left_col_w = 3.0*inch
+    col2_outer_w = frame_w - left_col_w
+    # inner width available to flowables inside the right column
+    right_col_inner_w = col2_outer_w - (cell_pad_left + cell_pad_right)
+    page_avail_h = page_height - (0.75*inch + 0.75*inch)
+
+    # create the thumbnail using the actual left column width so it
+    # doesn't dominate the page. Limit its height to ~60% of page
+    # available height so it can sit beside ingredients.
+    try:
+        thumb = recipe.get("thumbnail_layout") or recipe.get("thumbnail")
+        img = safe_image(thumb, max_width=left_col_w, max_height=page_avail_h * 0.6,
+                         dpi=IMAGE_PROFILES[IMAGE_PROFILE]["dpi"])
+        # extra safety: cap using left_col_w and page_avail_h
+        cur_w = float(getattr(img, 'drawWidth', getattr(img, 'imageWidth', left_col_w)))
+        cur_h = float(getattr(img, 'drawHeight', getattr(img, 'imageHeight', page_avail_h * 0.6)))
+        max_w = min(left_col_w, frame_w * 0.95)
+        max_h = min(page_avail_h * 0.6, page_avail_h * 0.95)
+        s_w = max_w / cur_w if cur_w > 0 else 1.0
+        s_h = max_h / cur_h if cur_h > 0 else 1.0
+        s = min(1.0, s_w, s_h)
+        if s < 1.0:
+            img.drawWidth = cur_w * s
+            img.drawHeight = cur_h * s
+    except Exception:
+        img = safe_image(recipe.get("thumbnail"), dpi=IMAGE_PROFILES[IMAGE_PROFILE]["dpi"])
+    try:
+        img._restrictSize(left_col_w, page_avail_h * 0.95)
+    except Exception:
+        pass
+    img.hAlign = "CENTER"
 
-        # If the image itself is still taller than the allowed row height,
-        # scale it down proportionally now so the table row can never exceed
-        # the page frame (this is the critical guard against LayoutError).
+    def stacked_image():
+        # no card behind a stacked thumbnail, so its corners go onto the page
+        source = getattr(img, 'source', None)
+        if source:
+            try:
+                source = rematte(source, PAGE_BACKGROUND)
+            except Exception:
+                pass
+        return FixedImage(source, getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch)), getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
+
+    # measure right column flowables
+    right_measures = []
+    total_right_h = 0.0
+    for flow in right_col:
         try:
-            if img_h > max(1.0, allowed_row_h):
-                scale_img = float(allowed_row_h) / float(img_h)
-                img.drawWidth = float(getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch))) * scale_img
-                img.drawHeight = float(getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch))) * scale_img
-                img_h = float(getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
+            # use the inner content width (subtracting left/right paddings)
+            w, h = flow.wrap(right_col_inner_w, page_avail_h)
         except Exception:
-            pass
+            h = 14 * max(1, (len(getattr(flow, 'text', '') or '').splitlines()))
+            w = right_col_inner_w
+        right_measures.append((flow, w, h))
+        total_right_h += h
+
+    # If any single flowable is already taller than the allowed row height
+    # then side-by-side will never work for this recipe; prefer stacking.
+    max_single_h = max((h for (_f, _w, h) in right_measures), default=0.0)
+
+    img_h = float(getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
+    # Account for table paddings when deciding if a single table row
+    # containing the image and the right column will fit on the page.
+    # Our table style uses TOPPADDING/BOTTOMPADDING = 16 each (see below),
+    # so subtract those paddings (and a tiny safety margin) from the
+    # available page height when comparing.
+    table_vertical_padding = 16 + 16
+    # increase safety margin to avoid near-miss LayoutErrors seen in the wild
+    safety_margin = 14
+    allowed_row_h = page_avail_h - table_vertical_padding - safety_margin
+
+    # If the image itself is still taller than the allowed row height,
+    # scale it down proportionally now so the table row can never exceed
+    # the page frame (this is the critical guard against LayoutError).
+    try:
+        if img_h > max(1.0, allowed_row_h):
+            scale_img = float(allowed_row_h) / float(img_h)
+            img.drawWidth = float(getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch))) * scale_img
+            img.drawHeight = float(getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch))) * scale_img
+            img_h = float(getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
+    except Exception:
+        pass
 
-        if max(img_h, total_right_h) <= allowed_row_h and max_single_h <= allowed_row_h:
-            # fits entirely side-by-side
-            # Use FixedImage wrapper so the table uses the exact wrap size
-            # we computed for the image (avoids later layout resizing).
-            cell_img = FixedImage(getattr(img, 'filename', None), getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch)), getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
-            # Do a conservative re-measure of the right-column height using a
-            # slightly narrower width than the true inner width to account for
-            # any subtle table/layout differences. If the conservative
-            # measurement still fits, we append the table; otherwise fall
-            # through to the split/stack logic below.
+    if max(img_h, total_right_h) <= allowed_row_h and max_single_h <= allowed_row_h:
+        # fits entirely side-by-side
+        # Use FixedImage wrapper so the table uses the exact wrap size
+        # we computed for the image (avoids later layout resizing).
+        cell_img = FixedImage(getattr(img, 'source', None), getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch)), getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
+        # Do a conservative re-measure of the right-column height using a
+        # slightly narrower width than the true inner width to account for
+        # any subtle table/layout differences. If the conservative
+        # measurement still fits, we append the table; otherwise fall
+        # through to the split/stack logic below.
+        extra_margin = 12
+        conservative_w = max(1.0, right_col_inner_w - extra_margin)
+        conservative_total = 0.0
+        for f in right_col:
+            try:
+                _w, _h = f.wrap(conservative_w, page_avail_h)
+            except Exception:
+                _h = 14 * max(1, (len(getattr(f, 'text', '') or '').splitlines()))
+            conservative_total += _h
+
+        t = Table([[cell_img, right_col]],
+                  colWidths=[left_col_w, col2_outer_w],
+                  style=[
+                      ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                      ("BACKGROUND", (0, 0), (-1, -1), colors.HexColor("#FFF9F3")),
+                      ("LEFTPADDING", (0, 0), (-1, -1), 18),
+                      ("RIGHTPADDING", (0, 0), (-1, -1), 18),
+                      ("TOPPADDING", (0, 0), (-1, -1), 16),
+                      ("BOTTOMPADDING", (0, 0), (-1, -1), 16),
+                  ])
+        # Only append the table if our conservative measurement predicts it fits
+        # require a modest safety factor on conservative_total to avoid
+        # underestimation causing Table row overflow during actual layout
+        safety_factor = 0.95
+        if max(img_h, conservative_total) <= allowed_row_h * safety_factor:
+            story.append(t)
+            story.append(Spacer(1, 0.4 * inch))
+            # append full-width instructions below the image+ingredients block
+            if instr_flow:
+                story.extend(instr_flow)
+                story.append(Spacer(1, 0.4 * inch))
+        else:
+            # don't append the oversized table; fall through to splitting
+            # logic below which will attempt a top-slice or stacking
+            pass
+    else:
+        # try to take a top slice that fits next to the image
+        prefix_h = 0.0
+        k = 0
+        for (flow, w, h) in right_measures:
+            # make the same allowance for table paddings when building
+            # a prefix that will sit next to the image
+            if prefix_h + h > allowed_row_h:
+                break
+            prefix_h += h
+            k += 1
+
+        if k > 0 and max(img_h, prefix_h) <= allowed_row_h:
+            right_top = [fm[0] for fm in right_measures[:k]]
+            right_bottom = [fm[0] for fm in right_measures[k:]]
+            cell_img = FixedImage(getattr(img, 'source', None), getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch)), getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
+            # conservative re-measure for the top slice as well
             extra_margin = 12
             conservative_w = max(1.0, right_col_inner_w - extra_margin)
-            conservative_total = 0.0
-            for f in right_col:
+            conservative_top = 0.0
+            for f in right_top:
                 try:
                     _w, _h = f.wrap(conservative_w, page_avail_h)
                 except Exception:
                     _h = 14 * max(1, (len(getattr(f, 'text', '') or '').splitlines()))
-                conservative_total += _h
+                conservative_top += _h
 
-            t = Table([[cell_img, right_col]],
+            t = Table([[cell_img, right_top]],
                       colWidths=[left_col_w, col2_outer_w],
                       style=[
                           ("VALIGN", (0, 0), (-1, -1), "TOP"),
@@ -1056,112 +1257,796 @@ def create_pdf(recipes):
                           ("TOPPADDING", (0, 0), (-1, -1), 16),
                           ("BOTTOMPADDING", (0, 0), (-1, -1), 16),
                       ])
-            # Only append the table if our conservative measurement predicts it fits
-            # require a modest safety factor on conservative_total to avoid
-            # underestimation causing Table row overflow during actual layout
+            # Only append the top-slice table if our conservative
+            # measurement predicts it fits side-by-side.
             safety_factor = 0.95
-            if max(img_h, conservative_total) <= allowed_row_h * safety_factor:
+            if max(img_h, conservative_top) <= allowed_row_h * safety_factor:
                 story.append(t)
+                story.append(Spacer(1, 0.08*inch))
+                story.extend(right_bottom)
                 story.append(Spacer(1, 0.4 * inch))
-                # append full-width instructions below the image+ingredients block
+                # append instructions below the block
                 if instr_flow:
                     story.extend(instr_flow)
                     story.append(Spacer(1, 0.4 * inch))
             else:
-                # don't append the oversized table; fall through to splitting
-                # logic below which will attempt a top-slice or stacking
-                pass
-        else:
-            # try to take a top slice that fits next to the image
-            prefix_h = 0.0
-            k = 0
-            for (flow, w, h) in right_measures:
-                # make the same allowance for table paddings when building
-                # a prefix that will sit next to the image
-                if prefix_h + h > allowed_row_h:
-                    break
-                prefix_h += h
-                k += 1
-
-            if k > 0 and max(img_h, prefix_h) <= allowed_row_h:
-                right_top = [fm[0] for fm in right_measures[:k]]
-                right_bottom = [fm[0] for fm in right_measures[k:]]
-                cell_img = FixedImage(getattr(img, 'filename', None), getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch)), getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch)))
-                # conservative re-measure for the top slice as well
-                extra_margin = 12
-                conservative_w = max(1.0, right_col_inner_w - extra_margin)
-                conservative_top = 0.0
-                for f in right_top:
-                    try:
-                        _w, _h = f.wrap(conservative_w, page_avail_h)
-                    except Exception:
-                        _h = 14 * max(1, (len(getattr(f, 'text', '') or '').splitlines()))
-                    conservative_top += _h
-
-                t = Table([[cell_img, right_top]],
-                          colWidths=[left_col_w, col2_outer_w],
-                          style=[
-                              ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                              ("BACKGROUND", (0, 0), (-1, -1), colors.HexColor("#FFF9F3")),
-                              ("LEFTPADDING", (0, 0), (-1, -1), 18),
-                              ("RIGHTPADDING", (0, 0), (-1, -1), 18),
-                              ("TOPPADDING", (0, 0), (-1, -1), 16),
-                              ("BOTTOMPADDING", (0, 0), (-1, -1), 16),
-                          ])
-                # Only append the top-slice table if our conservative
-                # measurement predicts it fits side-by-side.
-                safety_factor = 0.95
-                if max(img_h, conservative_top) <= allowed_row_h * safety_factor:
-                    story.append(t)
-                    story.append(Spacer(1, 0.08*inch))
-                    story.extend(right_bottom)
-                    story.append(Spacer(1, 0.4 * inch))
-                    # append instructions below the block
-                    if instr_flow:
-                        story.extend(instr_flow)
-                        story.append(Spacer(1, 0.4 * inch))
-                else:
-                    # Fall back to stacking when the conservative check fails
-                    story.append(FixedImage(getattr(img, 'filename', None), getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch)), getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch))))
-                    story.append(Spacer(1, 0.06*inch))
-                    story.extend(right_col)
-                    story.append(Spacer(1, 0.4 * inch))
-                    if instr_flow:
-                        story.extend(instr_flow)
-                        story.append(Spacer(1, 0.4 * inch))
-            else:
-                # fallback: stack image above the full right column
-                # For stacked layout we can append the original Image flowable
-                # (already sized), but wrap it in FixedImage too to be safe.
-                story.append(FixedImage(getattr(img, 'filename', None), getattr(img, 'drawWidth', getattr(img, 'imageWidth', 3.7*inch)), getattr(img, 'drawHeight', getattr(img, 'imageHeight', 6.0*inch))))
+                # Fall back to stacking when the conservative check fails
+                story.append(stacked_image())
                 story.append(Spacer(1, 0.06*inch))
                 story.extend(right_col)
                 story.append(Spacer(1, 0.4 * inch))
                 if instr_flow:
                     story.extend(instr_flow)
                     story.append(Spacer(1, 0.4 * inch))
+        else:
+            # fallback: stack image above the full right column
+            # For stacked layout we can append the original Image flowable
+            # (already sized), but wrap it in FixedImage too to be safe.
+            story.append(stacked_image())
+            story.append(Spacer(1, 0.06*inch))
+            story.extend(right_col)
+            story.append(Spacer(1, 0.4 * inch))
+            if instr_flow:
+                story.extend(instr_flow)
+                story.append(Spacer(1, 0.4 * inch))
+    return story
+
+def timed_recipe_flowables(recipes, styles, measure=None):
+    """recipe_flowables() for each recipe, timed as the "layout" stage."""
+    for recipe in recipes:
+        with TIMINGS.span("layout", recipe.get("shortcode")):
+            flows = recipe_flowables(recipe, styles, measure)
+        yield flows
+
+def _content_digest(src):
+    if isinstance(src, (bytes, bytearray)):
+        return hashlib.sha256(src).hexdigest()
+    if src and os.path.exists(src):
+        h = hashlib.sha256()
+        with open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    return None
+
+def _styles_signature(styles):
+    return sorted(
+        (name, sorted((k, repr(v)) for k, v in st.__dict__.items() if k != "parent"))
+        for name, st in styles.byName.items()
+    )
 
-    doc.build(
-        story,
-        onFirstPage=lambda c, d: (background(c, d), footer(c, d)),
-        onLaterPages=lambda c, d: (background(c, d), footer(c, d)),
+def fragment_key(fragments, recipe, styles_sig):
+    """Everything that changes how a recipe renders, hashed into one key."""
+    thumb = recipe.get("thumbnail_layout") or recipe.get("thumbnail")
+    return fragments.key(
+        recipe.get("url"),
+        title=recipe.get("title"),
+        caption=recipe.get("caption"),
+        # what the page actually shows, which changes with the parser even
+        # when the caption doesn't
+        sections=recipe.get("sections"),
+        parser=PARSER_VERSION,
+        thumbnail=_content_digest(thumb),
+        styles=styles_sig,
+        qr_mode=QR_MODE,
+        layout=LAYOUT_VERSION,
     )
+
+def _render_shard(job, measure=None):
+    """Lay out `recipes` into `path` with the page background only (page
+    numbers are stamped on after merging). Worker for render_shards();
+    must stay top-level so it pickles."""
+    from layout_measure import MeasureCache
+
+    recipes, path = job
+    if measure is None:
+        measure = MeasureCache()
+    mark = TIMINGS.mark()
+    styles = cookbook_styles()
+    doc = new_doc(path)
+    with TIMINGS.span("build"):
+        doc.build(LazyStory(timed_recipe_flowables(recipes, styles, measure)),
+                  onFirstPage=background, onLaterPages=background)
+    return doc.page, measure.hits, measure.misses, TIMINGS.samples_since(mark)
+
+def render_shards(jobs, workers=RENDER_WORKERS, measure=None):
+    """Render `(recipes, path)` jobs, in parallel processes when `workers`
+    is above 1. Returns the page count of each job."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers <= 1 or len(jobs) <= 1:
+        return [_render_shard(job, measure)[0] for job in jobs]
+    pages = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        for count, hits, misses, samples in pool.map(_render_shard, jobs):
+            pages.append(count)
+            TIMINGS.extend(samples)
+            if measure is not None:
+                measure.hits += hits
+                measure.misses += misses
+    return pages
+
+def build_sharded(recipes, workers=RENDER_WORKERS, measure=None):
+    """Build OUTPUT_PDF from `workers` contiguous shards rendered in
+    parallel. Apart from each shard starting on a new page, the pages match
+    a serial build, continuous page numbers included."""
+    from pdf_assembly import merge_pdfs
+
+    recipes = list(recipes)
+    size = ceil(len(recipes) / max(1, min(workers, len(recipes))))
+    shards = [recipes[i:i + size] for i in range(0, len(recipes), size)]
+    with tempfile.TemporaryDirectory(prefix="cookbook-shards-") as tmp:
+        jobs = [(shard, os.path.join(tmp, f"shard-{i:03d}.pdf")) for i, shard in enumerate(shards)]
+        render_shards(jobs, workers, measure)
+        with TIMINGS.span("merge"):
+            pages = merge_pdfs([path for _shard, path in jobs], OUTPUT_PDF, stamp=footer, pagesize=LETTER)
+    print(f"🧩 Rendered {len(recipes)} recipes in {len(jobs)} shards, {pages} pages")
+
+def build_incremental(recipes, styles, measure=None, workers=RENDER_WORKERS):
+    """Build OUTPUT_PDF from per-recipe fragments, re-rendering only new or
+    changed recipes. Fragments carry just the page background; page
+    numbers are stamped on after merging so they run across the book."""
+    from pdf_assembly import merge_pdfs
+
+    fragments = ImageStore(os.path.join(CACHE_DIR, "fragments"), FRAGMENT_CACHE_MAX_MB * 1024 * 1024,
+                           suffix=".pdf")
+    os.makedirs(fragments.root, exist_ok=True)
+    styles_sig = _styles_signature(styles)
+    paths = []
+    missing = {}
+    for recipe in recipes:
+        key = fragment_key(fragments, recipe, styles_sig)
+        path = fragments.get(key)
+        if path is None and key not in missing:
+            fd, tmp = tempfile.mkstemp(dir=fragments.root, suffix=".part")
+            os.close(fd)
+            missing[key] = ([recipe], tmp)
+        paths.append(path or key)  # key stands in until rendered below
+
+    try:
+        render_shards(list(missing.values()), workers, measure)
+    except Exception:
+        for _recipes, tmp in missing.values():
+            os.remove(tmp)
+        raise
+    stored = {key: fragments.put(key, tmp) for key, (_recipes, tmp) in missing.items()}
+    paths = [stored.get(p, p) for p in paths]
+    with TIMINGS.span("merge"):
+        pages = merge_pdfs(paths, OUTPUT_PDF, stamp=footer, pagesize=LETTER)
+    print(f"🧩 Fragments: {len(missing)} rendered, {len(paths) - len(missing)} reused, {pages} pages")
+
+def print_parsed(recipes):
+    """Print the parsed ingredients and steps of each recipe, e.g. to check
+    that hashtags and mentions were stripped."""
+    for idx, recipe in enumerate(recipes, 1):
+        parsed = recipe.get("sections") or split_sections_strict(recipe.get('caption', ''))
+        print(f"\n--- Recipe {idx}: {recipe.get('title')} ---")
+        print("Ingredients groups:")
+        for g, items in parsed.get('ingredients', {}).items():
+            print(f"  [{g}]")
+            for it in items:
+                print(f"    - {it}")
+        print("Instructions:")
+        for i, s in enumerate(parsed.get('instructions', []), 1):
+            print(f"  {i}. {s}")
+
+def diagnose_layout(recipes):
+    """Measurement-only pass: print per recipe how tall the image and the
+    right column come out and which layout recipe_flowables() would pick."""
+    from PIL import Image as PILImg
+    from reportlab.lib.styles import getSampleStyleSheet
+    from layout_measure import MeasureCache, MeasuredParagraph
+
+    page_width, page_height = LETTER
+    frame_w = page_width - (0.75*inch + 0.75*inch)
+    frame_h = page_height - (0.75*inch + 0.75*inch)
+    left_col_w = 3.7*inch
+    cell_pad_left = 18
+    cell_pad_right = 18
+    col2_outer_w = frame_w - left_col_w
+    right_col_inner_w = col2_outer_w - (cell_pad_left + cell_pad_right)
+    page_avail_h = page_height - (0.75*inch + 0.75*inch)
+    measure = MeasureCache()
+
+    def _diag_image_dims(path, max_width=3.7*inch, max_height=6.0*inch):
+        if not path or (isinstance(path, str) and not os.path.exists(path)):
+            return (max_width * 0.5, max_height * 0.5)
+        try:
+            with PILImg.open(_image_input(path)) as im:
+                w, h = im.size
+                target_w = int(max_width)
+                target_h = int(max_height)
+                scale = min(target_w / w, target_h / h, 1.0)
+                new_w = int(w * scale)
+                new_h = int(h * scale)
+                # treat pixels as points (image saved at 72dpi)
+                return float(new_w), float(new_h)
+        except Exception:
+            return (max_width, max_height)
+
+    for idx, recipe in enumerate(recipes, 1):
+        caption = recipe.get('caption', '')
+        parsed = recipe.get("sections") or split_sections_strict(caption)
+
+        # build a representative right_col similar to the main flow
+        right_col = []
+        right_col.append(MeasuredParagraph(recipe.get('title', ''), getSampleStyleSheet()['Title'], cache=measure))
+        # ingredients
+        right_col.append(MeasuredParagraph('Ingredients', getSampleStyleSheet()['Normal'], cache=measure))
+        ingredient_groups = parsed.get('ingredients', {'Ingredients': []})
+        multi_groups = len(ingredient_groups) > 1
+        for grp, items in ingredient_groups.items():
+            if multi_groups:
+                right_col.append(MeasuredParagraph(grp, getSampleStyleSheet()['Normal'], cache=measure))
+            if items:
+                if len(items) > 10:
+                    right_col.append(two_column_ingredients(items, getSampleStyleSheet()['Normal'], measure))
+                else:
+                    for it in items:
+                        right_col.append(MeasuredParagraph(it, getSampleStyleSheet()['Normal'], cache=measure))
+        right_col.append(MeasuredParagraph('Instructions', getSampleStyleSheet()['Normal'], cache=measure))
+        for i, step in enumerate(parsed.get('instructions', []), 1):
+            right_col.append(MeasuredParagraph(f"{i}. {step}", getSampleStyleSheet()['Normal'], cache=measure))
+
+        # Image metrics (diagnostic approximation using PIL)
+        img_w, img_h = _diag_image_dims(recipe.get('thumbnail'))
+
+        # measure right column
+        right_measures = []
+        total_right_h = 0.0
+        for flow in right_col:
+            try:
+                w, h = flow.wrap(right_col_inner_w, page_avail_h)
+            except Exception:
+                h = 14 * max(1, (len(getattr(flow, 'text', '') or '').splitlines()))
+                w = right_col_inner_w
+            right_measures.append((flow, w, h))
+            total_right_h += h
+
+        max_single_h = max((h for (_f, _w, h) in right_measures), default=0.0)
+
+        table_vertical_padding = 16 + 16
+        safety_margin = 6
+        allowed_row_h = page_avail_h - table_vertical_padding - safety_margin
+
+        # conservative re-measure
+        extra_margin = 8
+        conservative_w = max(1.0, right_col_inner_w - extra_margin)
+        conservative_total = 0.0
+        for f in right_col:
+            try:
+                _w, _h = f.wrap(conservative_w, page_avail_h)
+            except Exception:
+                _h = 14 * max(1, (len(getattr(f, 'text', '') or '').splitlines()))
+            conservative_total += _h
+
+        # compute top-slice k
+        prefix_h = 0.0
+        k = 0
+        for (_flow, _w, h) in right_measures:
+            if prefix_h + h > allowed_row_h:
+                break
+            prefix_h += h
+            k += 1
+
+        conservative_top = 0.0
+        if k > 0:
+            for f in [fm[0] for fm in right_measures[:k]]:
+                try:
+                    _w, _h = f.wrap(conservative_w, page_avail_h)
+                except Exception:
+                    _h = 14 * max(1, (len(getattr(f, 'text', '') or '').splitlines()))
+                conservative_top += _h
+
+        # decide
+        if max(img_h, conservative_total) <= allowed_row_h and max_single_h <= allowed_row_h:
+            decision = 'full-side-by-side'
+        elif k > 0 and max(img_h, conservative_top) <= allowed_row_h:
+            decision = f'top-slice(k={k})'
+        else:
+            decision = 'stack'
+
+        # print compact diagnostics
+        print(f"[{idx}] {recipe.get('title','Untitled')}")
+        print(f"    img={img_w:.1f}x{img_h:.1f} pts | right_total={total_right_h:.1f} pts | max_single={max_single_h:.1f} pts | allowed_row_h={allowed_row_h:.1f} pts")
+        print(f"    conservative_total={conservative_total:.1f} pts | k={k} | conservative_top={conservative_top:.1f} pts | decision={decision}")
+
+def create_pdf(recipes, incremental=INCREMENTAL_BUILD, workers=RENDER_WORKERS):
+    if DEBUG_LAYOUT:
+        print_parsed(recipes)
+        print("\nDEBUG_LAYOUT enabled — skipping PDF build.")
+        return
+
+    if DEBUG_DIAGNOSTICS:
+        diagnose_layout(recipes)
+        print("\nDEBUG_DIAGNOSTICS complete — no PDF built.")
+        return
+
+    from layout_measure import MeasureCache
+
+    _binary_streams()
+    styles = cookbook_styles()
+    # One measurement cache for the whole cookbook: the fit checks in
+    # recipe_flowables() and doc.build() all wrap the same paragraphs,
+    # often at the same widths.
+    measure = MeasureCache()
+
+    if incremental:
+        build_incremental(recipes, styles, measure, workers)
+    elif workers > 1:
+        build_sharded(recipes, workers, measure)
+    else:
+        story = LazyStory(timed_recipe_flowables(recipes, styles, measure))
+        with TIMINGS.span("build"):
+            new_doc(OUTPUT_PDF).build(story, onFirstPage=decorate_page, onLaterPages=decorate_page)
+    print(f"📐 Layout measurements: {measure.summary()}")
     print(f"✅ Cookbook saved as {OUTPUT_PDF}")
 
-def main():
-    L = instaloader.Instaloader(download_videos=False, download_comments=False, save_metadata=False)
+def sync_saved_posts(loader, manifest, collection=None, limit=None, limiter=None):
+    """Queue posts saved since the last sync; returns [(shortcode, url)]
+    oldest save first, so the cookbook grows in the order things were saved."""
+    from saved_sync import new_saved_shortcodes, require_login
+
+    require_login(loader)
+    name = loader.context.username + (f"__{collection}" if collection else "")
+    mark = SyncMark(os.path.join(CACHE_DIR, "sync", f"{name}.json"))
+    new = new_saved_shortcodes(loader, mark, collection, limit, limiter)
+    entries = [(code, f"https://www.instagram.com/p/{code}/") for code in reversed(new)]
+    # queue before moving the mark, so a crash can't lose these posts
+    for code, url in entries:
+        manifest.add(code, url)
+    mark.advance(new)
+    where = f"collection {collection!r}" if collection else "saved posts"
+    print(f"🔖 {len(new)} new in {where}")
+    return entries
+
+def new_limiter(username=None):
+    return AdaptiveRateLimiter.per_minute(SESSION_LIMITS.get(username, MAX_REQUESTS_PER_MINUTE),
+                                          RATE_LIMIT_BURST, min_per_minute=MIN_REQUESTS_PER_MINUTE,
+                                          pause=THROTTLE_PAUSE, max_pause=MAX_THROTTLE_PAUSE,
+                                          failure_threshold=CIRCUIT_FAILURES, name=username)
+
+def new_loader():
+    import instaloader
+
+    # one attempt per request: retries and backoff belong to the adaptive
+    # limiter, which can't react to a 429 Instaloader has already slept on
+    return instaloader.Instaloader(download_videos=False, download_comments=False, save_metadata=False,
+                                   max_connection_attempts=1)
+
+def open_session_pool(name):
+    """A SessionPool with one logged-in loader and limiter per account in
+    the named pool; accounts whose session can't be loaded are left out."""
+    from instaloader_login import load_pool
+
+    sessions = []
+    for username in load_pool(name):
+        loader = new_loader()
+        try:
+            loader.load_session_from_file(username)
+        except Exception as e:
+            print(f"⚠️ Could not load session for {username}: {e}")
+            continue
+        sessions.append((username, loader, new_limiter(username)))
+    if not sessions:
+        raise SystemExit(f"No usable sessions in pool {name!r}; re-run instaloader_login.py --pool {name}")
+    print(f"👥 Session pool {name!r}: {', '.join(n for n, _l, _r in sessions)}")
+    return SessionPool(sessions)
+
+# Subcommands; a command line starting with an option runs the whole
+# pipeline, as before subcommands existed.
+COMMANDS = ("run", "fetch", "render", "parse", "diagnose", "nutrition", "login")
+
+def _input_option(p, help):
+    p.add_argument("-i", "--input", help=help)
+
+def _fetch_options(p):
+    p.add_argument("--manifest", default=os.path.join(CACHE_DIR, "manifest.jsonl"),
+                   help="progress journal used to resume an interrupted run")
+    p.add_argument("--restart", action="store_true",
+                   help="forget earlier progress and process every URL again")
+    p.add_argument("--sync", nargs="?", const="", metavar="COLLECTION",
+                   help="add posts saved since the last sync (optionally from one named "
+                        "collection); the cookbook then covers every reel in the manifest")
+    p.add_argument("--sync-limit", type=int,
+                   help="take only the newest N saves and skip older ones (e.g. for a first sync)")
+    p.add_argument("--pool", default=SESSION_POOL,
+                   help="spread fetches over the accounts in this session pool")
+
+def _selection_options(p, render=True):
+    p.add_argument("--search", metavar="QUERY",
+                   help="use library recipes matching QUERY, best match first (e.g. 'chicken -rice')")
+    if render:
+        p.add_argument("--high-protein", type=int, metavar="N",
+                       help="build the PDF from the N library recipes (or --search matches) with the "
+                            "most protein per calorie")
+        p.add_argument("--limit", type=int, help="with --search: take only the N best matches")
+    p.add_argument("--max-calories", type=int, help="library selections: at most this many calories")
+    p.add_argument("--min-protein", type=int, help="library selections: at least this many grams of protein")
+
+def build_parser():
+    common = ArgumentParser(add_help=False)
+    common.add_argument("--library", default=LIBRARY_PATH,
+                        help="recipe library that fetched recipes are saved to and rendering reads")
+    common.add_argument("--timings", default=TIMING_REPORT, metavar="PATH",
+                        help="write per-stage, per-recipe timings as JSON")
+    common.add_argument("--prometheus", default=PROMETHEUS_TEXTFILE, metavar="PATH",
+                        help="write stage timing histograms as a Prometheus textfile (*.prom)")
+    common.add_argument("--profile", default=PROFILE_DIR, metavar="DIR",
+                        help="profile the command and write hot functions and collapsed stacks to DIR")
+    common.add_argument("--profile-mode", default=PROFILE_MODE, choices=("cprofile", "sample"))
+
+    p = ArgumentParser(description="Turn Instagram recipe reels into a PDF cookbook.")
+    sub = p.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    cmd = sub.add_parser("run", parents=[common], help="fetch, parse and render in one go (the default)")
+    _input_option(cmd, "file with reel/post URLs, one per line ('-' reads stdin); default REEL_URLS")
+    _fetch_options(cmd)
+    stage = cmd.add_mutually_exclusive_group()
+    stage.add_argument("--fetch-only", action="store_true",
+                       help="fetch and parse reels into the library without building a PDF")
+    stage.add_argument("--render-only", action="store_true",
+                       help="build the PDF from the library without contacting Instagram "
+                            "(with -i, only those reels, in that order)")
+    _selection_options(cmd)
+    cmd.add_argument("--nutrition-report", nargs="?", const="", metavar="PATH",
+                     help="print servings/macro statistics for the library (or --search matches) "
+                          "instead of building a PDF; with PATH also save them as JSON")
+    cmd.set_defaults(func=run)
+
+    cmd = sub.add_parser("fetch", parents=[common],
+                         help="fetch and parse reels into the library without building a PDF")
+    _input_option(cmd, "file with reel/post URLs, one per line ('-' reads stdin); default REEL_URLS")
+    _fetch_options(cmd)
+    cmd.set_defaults(func=fetch_command)
+
+    cmd = sub.add_parser("render", parents=[common],
+                         help="build the PDF from the library without contacting Instagram")
+    _input_option(cmd, "only these reels, in this order (file of URLs, '-' reads stdin)")
+    _selection_options(cmd)
+    cmd.set_defaults(func=render_command)
+
+    cmd = sub.add_parser("parse", parents=[common],
+                         help="parse library captions that the current parser hasn't seen")
+    _input_option(cmd, "only these reels (file of URLs, '-' reads stdin)")
+    cmd.add_argument("--all", action="store_true", help="parse every caption again, not just stale ones")
+    cmd.add_argument("--show", action="store_true", help="print the parsed ingredients and steps")
+    batch = cmd.add_argument_group("caption archives", "parse a JSONL dump instead of the library")
+    batch.add_argument("--jsonl", metavar="PATH",
+                       help="JSONL of captions ('-' reads stdin): objects with a caption field, or strings")
+    batch.add_argument("-o", "--output", default="-", metavar="PATH",
+                       help="where the parsed JSONL goes, in input order (default stdout)")
+    batch.add_argument("--field", default="caption", help="name of the caption field in each object")
+    batch.add_argument("--workers", type=int, default=PARSE_WORKERS)
+    batch.add_argument("--chunk-size", type=int, default=PARSE_CHUNK_SIZE)
+    cmd.set_defaults(func=parse_command)
+
+    cmd = sub.add_parser("diagnose", parents=[common],
+                         help="print how each library recipe would be laid out, without building a PDF")
+    _input_option(cmd, "only these reels (file of URLs, '-' reads stdin)")
+    cmd.set_defaults(func=diagnose_command)
+
+    cmd = sub.add_parser("nutrition", parents=[common],
+                         help="print servings/macro statistics for the library")
+    cmd.add_argument("path", nargs="?", help="also save the statistics as JSON here")
+    _selection_options(cmd, render=False)
+    cmd.set_defaults(func=nutrition_command)
+
+    # options are parsed by instaloader_login itself (see `login --help`)
+    cmd = sub.add_parser("login", add_help=False, prefix_chars="+",
+                         help="import a Firefox login into an instaloader session or session pool")
+    cmd.add_argument("login_args", nargs=REMAINDER)
+    cmd.set_defaults(func=login_command)
+    return p
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or (argv[0].startswith("-") and argv[0] not in ("-h", "--help")):
+        argv.insert(0, "run")
+    args = build_parser().parse_args(argv)
+    if args.command == "login":
+        return login_command(args)
     try:
-        L.load_session_from_file(SESSION_USER)
-    except FileNotFoundError:
-        pass
-    except Exception as e:
-        print(f"⚠️ Could not load session: {e}")
+        if args.profile:
+            from profiling import profile_call
+
+            profile_call(lambda: args.func(args), args.profile, args.profile_mode, PROFILE_INTERVAL)
+        else:
+            args.func(args)
+    finally:
+        write_timing_reports(args.timings, args.prometheus)
 
-    recipes = []
-    for url in REEL_URLS:
-        data = fetch_reel_data_with_instaloader(url, L)
-        if data:
-            recipes.append(data)
+def write_timing_reports(json_path=None, prometheus_path=None):
+    if not (json_path or prometheus_path):
+        return
+    if json_path:
+        TIMINGS.write_json(json_path)
+    if prometheus_path:
+        TIMINGS.write_prometheus(prometheus_path)
+    print(f"⏱️ Stage timings: {TIMINGS.summary()}")
+
+def render_from_library(library, source=None):
+    """Build the cookbook from stored recipes only; nothing here talks to
+    Instagram. `source` (see read_urls) picks and orders the recipes,
+    otherwise the whole library is used in the order it was fetched."""
+    codes = [code for code, _url in dedupe_urls(read_urls(source))] if source else None
+    records = list(library.load(codes))
+    print(f"📚 {len(records)} recipes from {library.path}"
+          + (f" ({len(codes) - len(records)} requested ones not in it)" if codes and len(codes) > len(records) else ""))
+    render_records(library, records)
+
+def render_search(library, query=None, limit=None, **bounds):
+    """Build the cookbook from the library recipes matching a search; see
+    RecipeLibrary.search for `query` and the `bounds` filters."""
+    started = time.perf_counter()
+    records = library.search(query, limit, **bounds)
+    took = (time.perf_counter() - started) * 1000
+    filters = ", ".join(f"{k.replace('_', ' ')} {v}" for k, v in bounds.items() if v is not None)
+    print(f"🔎 {len(records)} recipes match {query or 'everything'!r}"
+          + (f" ({filters})" if filters else "") + f" in {took:.1f} ms")
+    for record in records[:10]:
+        print(f"   {record.title}")
+    if len(records) > 10:
+        print(f"   … and {len(records) - 10} more")
+    render_records(library, records)
+
+def _macro_table(library, query=None, **bounds):
+    from macro_table import MacroTable
+
+    if query:
+        return MacroTable.from_records(library.search(query, None, **bounds))
+    return MacroTable.from_library(library)
+
+def render_high_protein(library, count, query=None, **bounds):
+    """Build the cookbook from the `count` recipes with the most protein
+    per 100 kcal, among `query` matches when given, within `bounds`."""
+    table = _macro_table(library, query, **bounds)
+    ratio = table.protein_per_100_cal()
+    picks = table.top_k(ratio, count, table.mask(**bounds))
+    print(f"💪 {len(picks)} of {len(table)} recipes picked for protein per 100 kcal")
+    for i in picks[:10]:
+        print(f"   {ratio[i]:5.1f} g  {table.titles[i]}")
+    if len(picks) > 10:
+        print(f"   … and {len(picks) - 10} more")
+    render_records(library, library.load([table.codes[i] for i in picks]))
+
+def nutrition_report(library, path=None, query=None, **bounds):
+    """Print macro statistics over the library (or `query` matches) within
+    `bounds`, and save them as JSON at `path` when given."""
+    table = _macro_table(library, query, **bounds)
+    report = table.report(table.mask(**bounds))
+    print(f"🥗 Nutrition over {report['recipes']} of {len(table)} recipes")
+    print(f"   {'':20} {'known':>6} {'mean':>8} {'median':>8} {'min':>7} {'max':>7}")
+    for name, stats in report.items():
+        if name == "recipes":
+            continue
+        if stats["known"]:
+            print(f"   {name:20} {stats['known']:6d} {stats['mean']:8.1f} {stats['median']:8.1f} "
+                  f"{stats['min']:7.1f} {stats['max']:7.1f}")
+        else:
+            print(f"   {name:20} {0:6d}")
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"🥗 Saved report to {path}")
+
+def library_recipes(library, records):
+    """Pipeline recipe dicts for library `records`, ready for layout."""
+    recipes = [record.as_dict() for record in records]
+    # captions parsed by an older parser version are parsed again and saved
+    stale = [r for r in recipes if "sections" not in r]
+    if stale:
+        library.save_many(Recipe.from_dict(r) for r in parse_recipes(stale))
+        print(f"📚 Re-parsed {len(stale)} captions")
+    recipes = [r for r in recipes if "sections" in r]
+    if recipes:
+        prepare_images(recipes, None, IMAGE_WORKERS, IN_MEMORY_IMAGES)
+    return recipes
+
+def render_records(library, records):
+    recipes = library_recipes(library, records)
+    if not recipes:
+        print("No valid reels found.")
+        return
+    create_pdf(recipes)
+
+def _in_order(codes, stored, fetched):
+    """Recipes in `codes` order: from `stored` ({code: recipe}) where there,
+    otherwise the next of `fetched`, which follows the same order but lacks
+    the reels that failed."""
+    fetched = iter(fetched)
+    pending = None
+    for code in codes:
+        if code in stored:
+            yield stored[code]
+            continue
+        if pending is None:
+            pending = next(fetched, None)
+        if pending is not None and pending.get("shortcode") == code:
+            yield pending
+            pending = None
+
+def _bounds(args):
+    return {"max_cal": args.max_calories, "min_protein": args.min_protein}
+
+def _selects(args):
+    return bool(args.high_protein) or args.search is not None or any(
+        v is not None for v in _bounds(args).values())
+
+def render_selection(library, args):
+    if args.input:
+        raise SystemExit("--search picks recipes from the library; it can't be combined with -i")
+    if args.high_protein:
+        render_high_protein(library, args.high_protein, args.search, **_bounds(args))
+    else:
+        render_search(library, args.search, args.limit, **_bounds(args))
+
+def open_library(path, create=False):
+    """The RecipeLibrary at `path`. Only commands that fetch may create it;
+    the others fail on a missing library instead of leaving an empty
+    database (and its directory) behind."""
+    if not create and not os.path.exists(path):
+        raise SystemExit(f"No recipe library at {path}; fetch some reels first or pass --library")
+    return RecipeLibrary(path)
+
+def run(args):
+    """The fetch -> images -> parse -> PDF pipeline for parsed `main()` args."""
+    reads_only = args.nutrition_report is not None or _selects(args) or args.render_only
+    library = open_library(args.library, create=not reads_only)
+    if args.nutrition_report is not None:
+        nutrition_report(library, args.nutrition_report, args.search, **_bounds(args))
+        return
+    if _selects(args):
+        render_selection(library, args)
+        return
+    if args.render_only:
+        render_from_library(library, args.input)
+        return
+    fetch_and_build(args, library, args.fetch_only)
+
+def fetch_command(args):
+    fetch_and_build(args, open_library(args.library, create=True), fetch_only=True)
+
+def render_command(args):
+    library = open_library(args.library)
+    if _selects(args):
+        render_selection(library, args)
+    else:
+        render_from_library(library, args.input)
+
+def _library_records(library, source=None):
+    codes = [code for code, _url in dedupe_urls(read_urls(source))] if source else None
+    return list(library.load(codes))
+
+def parse_command(args):
+    """Parse library captions again: those parsed by an older parser
+    version (or never), or all of them with --all. With --jsonl, parse a
+    caption archive instead (see parse_archive)."""
+    if args.jsonl:
+        parse_archive(args.jsonl, args.output, args.workers, args.chunk_size, args.field)
+        return
+    library = open_library(args.library)
+    records = _library_records(library, args.input)
+    if args.all:
+        for record in records:
+            record.sections = None
+    recipes = [record.as_dict() for record in records]
+    stale = [r for r in recipes if "sections" not in r]
+    library.save_many(Recipe.from_dict(r) for r in parse_recipes(stale))
+    print(f"📚 Parsed {len(stale)} of {len(recipes)} captions in {library.path}")
+    if args.show:
+        print_parsed(recipes)
+
+def parse_archive(source, output="-", workers=PARSE_WORKERS, chunk_size=PARSE_CHUNK_SIZE, field="caption"):
+    """Stream the JSONL captions in `source` through split_sections_strict
+    in a process pool and write the parsed records to `output` (see
+    batch_parse.parse_jsonl). The summary goes to stderr, so the records
+    can go to stdout."""
+    from batch_parse import parse_jsonl
+
+    src = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    out = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    started = time.perf_counter()
+    try:
+        with TIMINGS.span("parse_batch"):
+            stats = parse_jsonl(src, out, workers, chunk_size, field)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+    took = time.perf_counter() - started
+    rate = stats.records / took if took else 0.0
+    print(f"📚 Parsed {stats.summary()} in {took:.1f}s ({rate:.0f}/s, {workers} workers)", file=sys.stderr)
+    return stats
+
+def diagnose_command(args):
+    library = open_library(args.library)
+    recipes = list(parse_recipes(record.as_dict() for record in _library_records(library, args.input)))
+    diagnose_layout(recipes)
+
+def nutrition_command(args):
+    nutrition_report(open_library(args.library), args.path, args.search, **_bounds(args))
+
+def login_command(args):
+    from instaloader_login import main as login
+
+    login(args.login_args, prog=f"{os.path.basename(sys.argv[0])} login")
+
+def fetch_and_build(args, library, fetch_only=False):
+    """Fetch the reels named by `args` (URLs, manifest, saved-post sync),
+    save them to `library`, and build the PDF unless `fetch_only`."""
+    sessions = open_session_pool(args.pool) if args.pool else None
+    if sessions:
+        _user, L, limiter = sessions.sessions[0]
+        workers = FETCH_WORKERS * len(sessions)
+    else:
+        L = new_loader()
+        try:
+            L.load_session_from_file(SESSION_USER)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Could not load session: {e}")
+        limiter = new_limiter()
+        workers = FETCH_WORKERS
+
+    manifest = RunManifest(args.manifest)
+    if args.restart:
+        manifest.reset()
+    if args.sync is None:
+        entries = dedupe_urls(read_urls(args.input) if args.input else REEL_URLS)
+    else:
+        entries = dedupe_urls(read_urls(args.input)) if args.input else []
+        entries += sync_saved_posts(L, manifest, args.sync or None, args.sync_limit, limiter)
+    for code, url in entries:
+        manifest.add(code, url)
+    if args.sync is not None:
+        entries = [(code, e["url"]) for code, e in manifest.items.items() if e.get("url")]
+    codes = [code for code, _url in entries]
+    counts = manifest.counts(codes)
+    done = counts.get(RunManifest.STATES[-1], 0)
+    failed = counts.get(RunManifest.FAILED, 0)
+    print(f"📋 {len(codes)} reels: {done} already done, {len(codes) - done} to do"
+          + (f" ({failed} failed last time)" if failed else ""))
+    # finished reels come from the library; only the rest go to Instagram
+    finished = {code for code in codes if manifest.finished(code) and code in library}
+    stored = {}
+    if finished and not fetch_only:
+        stored = {r["shortcode"]: r for r in library_recipes(library, library.load(c for c in codes if c in finished))}
+    if finished:
+        print(f"📚 {len(finished)} finished reels taken from {library.path}")
+
+    meta_cache = MetadataCache(os.path.join(CACHE_DIR, "meta"), META_CACHE_TTL, FORCE_REFRESH)
+    # anything this batch already fetched is reused as-is, even past the TTL
+    meta_cache.pin(code for code in codes if manifest.state(code) in RunManifest.STATES[1:])
+    image_store = ImageStore(os.path.join(CACHE_DIR, "images"), IMAGE_CACHE_MAX_MB * 1024 * 1024, suffix=".jpg")
+    urls = [url for code, url in entries if code not in finished]
+
+    if STREAMING_BUILD:
+        fetched = import_recipes(library, parse_recipes(_mark(iter_prepared(
+            iter_reels(urls, L, workers, limiter, meta_cache, image_store, defer_effects=True,
+                       in_memory=IN_MEMORY_IMAGES, manifest=manifest, sessions=sessions),
+            image_store, IMAGE_WORKERS, IN_MEMORY_IMAGES), manifest, "image-ready"), manifest))
+        if fetch_only:
+            print(f"📚 Saved {sum(1 for _ in fetched)} recipes to {library.path}")
+            return
+        recipes = _in_order(codes, stored, fetched)
+        first = next(recipes, None)
+        if first is None:
+            print("No valid reels found.")
+            return
+        create_pdf(chain([first], recipes))
+        return
+
+    fetched = fetch_reels(urls, L, workers, limiter, meta_cache, image_store, defer_effects=True,
+                          in_memory=IN_MEMORY_IMAGES, manifest=manifest, sessions=sessions)
+    prepare_images(fetched, image_store, IMAGE_WORKERS, IN_MEMORY_IMAGES)
+    fetched = list(import_recipes(library, parse_recipes(_mark(fetched, manifest, "image-ready"), manifest)))
+    if fetch_only:
+        print(f"📚 Saved {len(fetched)} recipes to {library.path}")
+        return
+    recipes = list(_in_order(codes, stored, fetched))
 
     if recipes:
         create_pdf(recipes)
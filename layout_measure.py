@@ -0,0 +1,85 @@
+"""Memoized paragraph measurement for the cookbook layout."""
+from collections import OrderedDict
+
+from reportlab.platypus import Paragraph
+from reportlab.platypus.paragraph import _FUZZ
+
+
+class MeasureCache:
+    """Line breaks and heights keyed by (text, style, available width).
+
+    `create_pdf` wraps every right-column flowable several times: once at
+    the column width, again at the narrower "conservative" width, and then
+    once more (twice for table cells) during `doc.build`. Paragraphs that
+    share a cache only break their lines once per distinct width, and
+    repeated text such as the "Ingredients" header or a common ingredient
+    line is measured once for the whole cookbook.
+
+    Styles are compared by their attributes rather than by name, so two
+    styles that render identically share entries. The oldest entries are
+    dropped once `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries=8192):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._style_keys = {}
+
+    def style_key(self, style):
+        # keep the style object alive alongside its key so id() can't be reused
+        cached = self._style_keys.get(id(style))
+        if cached is not None and cached[0] is style:
+            return cached[1]
+        key = tuple(sorted((k, repr(v)) for k, v in style.__dict__.items()
+                           if k not in ("name", "parent")))
+        self._style_keys[id(style)] = (style, key)
+        return key
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"{total} wraps, {self.hits} cached ({rate:.0%}), {self.misses} measured"
+
+
+class MeasuredParagraph(Paragraph):
+    """A `Paragraph` whose `wrap()` is answered from a `MeasureCache`.
+
+    The cached line breaks (`blPara`) are only read when drawing or
+    splitting, so paragraphs with the same key can safely share them.
+    Paragraphs created by `split()` get no cache and behave normally.
+    """
+
+    def __init__(self, text, style=None, bulletText=None, frags=None, cache=None, **kw):
+        super().__init__(text, style, bulletText=bulletText, frags=frags, **kw)
+        self._measure = cache
+        self._measure_text = text
+
+    def wrap(self, availWidth, availHeight):
+        cache = self._measure
+        if cache is None or self._measure_text is None or availWidth < _FUZZ:
+            return super().wrap(availWidth, availHeight)
+        key = (self._measure_text, self.bulletText, cache.style_key(self.style), round(availWidth, 3))
+        hit = cache.get(key)
+        if hit is None:
+            width, height = super().wrap(availWidth, availHeight)
+            cache.put(key, (self.blPara, self._wrapWidths, height))
+            return width, height
+        self.blPara, self._wrapWidths, self.height = hit
+        self.width = availWidth
+        return availWidth, self.height
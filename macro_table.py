@@ -0,0 +1,121 @@
+"""Servings and macros of many recipes as NumPy columns."""
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    raise SystemExit("numpy not found (needed for macro filtering and ranking).\n  pip install [--user] numpy")
+
+from recipe_store import MACRO_COLUMNS
+
+
+class MacroTable:
+    """One float column per entry in MACRO_COLUMNS (servings, cal,
+    protein, carbs, fat), each with a `known` mask, aligned with `codes`.
+
+    Values not found in a caption are NaN in `values` and False in
+    `known`. Every operation works on whole columns at once, so filtering
+    or ranking tens of thousands of recipes is a few array passes rather
+    than a Python loop over section dicts. Derived values whose inputs
+    are missing stay NaN, and a NaN never passes a filter or makes a
+    top-k list.
+    """
+
+    def __init__(self, codes, titles, columns):
+        self.codes = list(codes)
+        self.titles = list(titles)
+        self.values = {name: np.asarray(columns[name], dtype=np.float64) for name in MACRO_COLUMNS}
+        self.known = {name: ~np.isnan(col) for name, col in self.values.items()}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From (shortcode, title, servings, cal, protein, carbs, fat)
+        tuples, with None for missing values."""
+        rows = list(rows)
+        data = np.array([row[2:] for row in rows], dtype=np.float64).reshape(len(rows), len(MACRO_COLUMNS))
+        columns = {name: data[:, i] for i, name in enumerate(MACRO_COLUMNS)}
+        return cls([row[0] for row in rows], [row[1] for row in rows], columns)
+
+    @classmethod
+    def from_library(cls, library):
+        """Every recipe in a RecipeLibrary, in library order, read straight
+        from its macro columns."""
+        return cls.from_rows(library.macro_rows())
+
+    @classmethod
+    def from_records(cls, records):
+        """From Recipe records (or anything with shortcode/title/sections)."""
+        rows = []
+        for r in records:
+            sections = r.sections or {}
+            macros = sections.get("macros") or {}
+            rows.append((r.shortcode, r.title, sections.get("servings"))
+                        + tuple(macros.get(k) for k in MACRO_COLUMNS[1:]))
+        return cls.from_rows(rows)
+
+    def column(self, name):
+        return self.values[name]
+
+    def mask(self, **bounds):
+        """Boolean mask of recipes within all `bounds`, given as
+        `min_<column>` / `max_<column>` like RecipeLibrary.search."""
+        keep = np.ones(len(self), dtype=bool)
+        for name, value in bounds.items():
+            if value is None:
+                continue
+            op, _, column = name.partition("_")
+            if op not in ("min", "max") or column not in self.values:
+                raise TypeError(f"unknown bound {name!r}")
+            col = self.values[column]
+            with np.errstate(invalid="ignore"):
+                keep &= (col >= value) if op == "min" else (col <= value)
+        return keep
+
+    def per_serving(self, name):
+        """`name` divided by servings, for captions that give macros for
+        the whole batch ("Makes 4 ... 2000 calories"). NaN when servings
+        or the value is unknown."""
+        servings = self.values["servings"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(servings > 0, self.values[name] / servings, np.nan)
+
+    def protein_per_100_cal(self):
+        """Grams of protein per 100 kcal; NaN unless both are known and
+        calories are positive."""
+        cal = self.values["cal"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(cal > 0, self.values["protein"] * 100.0 / cal, np.nan)
+
+    def top_k(self, scores, k, mask=None, ascending=False):
+        """Indices of the `k` best `scores` (highest first, or lowest with
+        `ascending`), skipping NaN and anything outside `mask`."""
+        scores = np.asarray(scores, dtype=np.float64)
+        ok = ~np.isnan(scores)
+        if mask is not None:
+            ok &= mask
+        candidates = np.flatnonzero(ok)
+        if not len(candidates) or k <= 0:
+            return candidates[:0]
+        keyed = scores[candidates] if ascending else -scores[candidates]
+        if k < len(candidates):
+            part = np.argpartition(keyed, k - 1)[:k]
+            candidates, keyed = candidates[part], keyed[part]
+        return candidates[np.argsort(keyed, kind="stable")]
+
+    def report(self, mask=None):
+        """Per-column count of known values with mean, median, min and max
+        (over recipes in `mask`, default all), plus protein per 100 kcal."""
+        columns = dict(self.values)
+        columns["protein_per_100_cal"] = self.protein_per_100_cal()
+        out = {"recipes": int(len(self) if mask is None else mask.sum())}
+        for name, col in columns.items():
+            if mask is not None:
+                col = col[mask]
+            known = col[~np.isnan(col)]
+            stats = {"known": int(known.size)}
+            if known.size:
+                stats.update(mean=float(known.mean()), median=float(np.median(known)),
+                             min=float(known.min()), max=float(known.max()))
+            out[name] = stats
+        return out
@@ -0,0 +1,48 @@
+"""Stitch separately rendered PDFs into one cookbook."""
+import io
+import os
+
+from reportlab.lib.pagesizes import LETTER
+from reportlab.pdfgen.canvas import Canvas
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ModuleNotFoundError:
+    raise SystemExit("pypdf not found (needed to merge PDF fragments).\n  pip install [--user] pypdf")
+
+
+def _stamp_overlay(page_count, stamp, pagesize):
+    # One overlay page per output page, drawn with the same callback a
+    # normal build uses, so merged numbering looks identical.
+    buf = io.BytesIO()
+    c = Canvas(buf, pagesize=pagesize)
+    for page in range(1, page_count + 1):
+        stamp(c, page)
+        c.showPage()
+    c.save()
+    buf.seek(0)
+    return PdfReader(buf)
+
+
+def merge_pdfs(paths, output, stamp=None, pagesize=LETTER):
+    """Concatenate the PDFs at `paths` into `output`.
+
+    `stamp(canvas, page_number)` is drawn on top of every merged page with
+    its position in the final document, which is how page numbers stay
+    continuous across fragments that were rendered on their own. Returns
+    the number of pages written.
+    """
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    page_count = len(writer.pages)
+    if stamp is not None and page_count:
+        overlay = _stamp_overlay(page_count, stamp, pagesize)
+        for page, over in zip(writer.pages, overlay.pages):
+            page.merge_page(over)
+            page.compress_content_streams()
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        writer.write(f)
+    os.replace(tmp, output)
+    return page_count
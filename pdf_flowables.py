@@ -0,0 +1,71 @@
+"""Custom ReportLab flowables used on the recipe pages."""
+import io
+
+from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable
+
+
+# Small helper flowable that reports a fixed wrap size and draws the
+# image at that exact size. Using this prevents ReportLab/Table from
+# later re-interpreting pixel/DPI metadata and accidentally resizing
+# the image during table layout (which caused the LayoutError).
+class FixedImage(Flowable):
+    def __init__(self, path, width, height, hAlign="CENTER"):
+        super().__init__()
+        self.path = path
+        self._w = float(width)
+        self._h = float(height)
+        self.hAlign = hAlign
+
+    def wrap(self, availWidth, availHeight):
+        return self._w, self._h
+
+    def draw(self):
+        # decode only now and drop the reader straight after, so queued
+        # flowables don't each hold an open file or decoded pixels
+        if not self.path:
+            return
+        src = io.BytesIO(self.path) if isinstance(self.path, (bytes, bytearray)) else self.path
+        try:
+            reader = ImageReader(src)
+        except Exception:
+            return
+        # draw at origin; callers control alignment via Table cell paddings
+        self.canv.drawImage(reader, 0, 0, width=self._w, height=self._h,
+                            preserveAspectRatio=True, anchor='sw')
+
+
+class QRCodeFlowable(Flowable):
+    """QR code drawn as native PDF rectangles instead of an embedded PNG.
+
+    `runs(url)` returns the code as (modules, ((row, col, w, h), ...)),
+    one tuple per filled rectangle in module units.
+    """
+
+    def __init__(self, url, size, runs, hAlign="RIGHT"):
+        super().__init__()
+        self.url = url
+        self.size = float(size)
+        self.runs = runs
+        self.hAlign = hAlign
+
+    def wrap(self, availWidth, availHeight):
+        return self.size, self.size
+
+    def draw(self):
+        modules, runs = self.runs(self.url)
+        canv = self.canv
+        canv.saveState()
+        # work in module units: every coordinate below is a small integer,
+        # which keeps the content stream short
+        canv.scale(self.size / modules, self.size / modules)
+        # white quiet zone so the code still scans on the cream background
+        canv.setFillColor(colors.white)
+        canv.rect(0, 0, modules, modules, stroke=0, fill=1)
+        canv.setFillColor(colors.black)
+        path = canv.beginPath()
+        for y, x, w, h in runs:
+            path.rect(x, modules - y - h, w, h)
+        canv.drawPath(path, stroke=0, fill=1)
+        canv.restoreState()
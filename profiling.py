@@ -0,0 +1,147 @@
+"""Profile a cookbook run: hot functions plus flamegraph-ready stacks."""
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+MODES = ("cprofile", "sample")
+
+
+def _frame_label(code):
+    path = code.co_filename
+    # keep library paths readable: reportlab/platypus/doctemplate.py, not
+    # the whole site-packages prefix
+    for marker in ("site-packages" + os.sep, "dist-packages" + os.sep):
+        if marker in path:
+            path = path.split(marker, 1)[1]
+            break
+    else:
+        path = os.path.basename(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _thread_label(thread):
+    # ThreadPoolExecutor-0_3 -> ThreadPoolExecutor-0, so workers of one
+    # pool merge into a single tower in the flamegraph
+    return re.sub(r"_\d+$", "", thread.name) if thread else "thread"
+
+
+class StackSampler:
+    """Wall-clock sampling profiler for every thread of this process.
+
+    A background thread snapshots all other threads' stacks every
+    `interval` seconds and counts identical stacks, root first, with the
+    thread name as the root frame. The counts are written in the
+    "collapsed" format that flamegraph.pl, speedscope and inferno read.
+    Threads waiting on I/O or locks are sampled too, so the picture shows
+    where wall time goes, not only CPU time.
+    """
+
+    def __init__(self, interval=0.005, max_depth=200):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            threads = {t.ident: t for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(_thread_label(threads.get(ident)))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def hotspots(self, top=40):
+        """Text table of the functions seen most often, by own (leaf)
+        samples and by inclusive samples."""
+        own, inclusive = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                own[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+        total = sum(self.stacks.values()) or 1
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms", "",
+                 f"{'own %':>7} {'incl %':>7}  function"]
+        for label, count in own.most_common(top):
+            lines.append(f"{count / total:7.1%} {inclusive[label] / total:7.1%}  {label}")
+        return "\n".join(lines) + "\n"
+
+
+def _pstats_hotspots(profiler, top=40):
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    out.write("Top functions by own time (tottime)\n")
+    stats.sort_stats("tottime").print_stats(top)
+    out.write("\nTop functions by cumulative time (cumtime)\n")
+    stats.sort_stats("cumulative").print_stats(top)
+    return out.getvalue()
+
+
+def profile_call(fn, out_dir, mode="cprofile", interval=0.005, top=40):
+    """Run `fn()` under the profiler and write the results to `out_dir`.
+
+    Both modes write `stacks.collapsed` (from a stack sampler) and
+    `hotspots.txt`. "cprofile" adds deterministic call counts and timings
+    from cProfile (`hotspots.txt` then comes from cProfile and the raw
+    stats are kept in `profile.pstats` for snakeviz or pstats); "sample"
+    skips cProfile, so timings aren't inflated by tracing overhead.
+    cProfile only traces the calling thread (fetch threads show up in the
+    sampled stacks only), and neither profiles pool worker processes.
+    Returns what `fn()` returned.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown profile mode {mode!r}; use one of {', '.join(MODES)}")
+    os.makedirs(out_dir, exist_ok=True)
+    sampler = StackSampler(interval)
+    profiler = cProfile.Profile() if mode == "cprofile" else None
+    started = time.perf_counter()
+    sampler.start()
+    if profiler:
+        profiler.enable()
+    try:
+        return fn()
+    finally:
+        if profiler:
+            profiler.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        sampler.write_collapsed(os.path.join(out_dir, "stacks.collapsed"))
+        if profiler:
+            profiler.dump_stats(os.path.join(out_dir, "profile.pstats"))
+            report = _pstats_hotspots(profiler, top)
+        else:
+            report = sampler.hotspots(top)
+        with open(os.path.join(out_dir, "hotspots.txt"), "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"🔬 Profiled {elapsed:.1f}s ({mode}, {sampler.samples} stack samples) -> {out_dir}")
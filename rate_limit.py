@@ -0,0 +1,279 @@
+"""Rate limiting helpers shared by the cookbook fetch stages."""
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    Tokens refill at ``rate`` per second up to ``capacity``. ``acquire()``
+    blocks until enough tokens are available, so any number of worker
+    threads sharing one bucket stay under a combined request ceiling.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, burst=None):
+        return cls(requests_per_minute / 60.0, burst)
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._last = now
+
+    def acquire(self, tokens=1):
+        """Block until ``tokens`` are available, then consume them."""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def call(self, fn, *args, **kwargs):
+        """Acquire one token, then run ``fn(*args, **kwargs)``."""
+        self.acquire()
+        return fn(*args, **kwargs)
+
+
+THROTTLED = "throttled"
+FAILED = "failed"
+
+# Exceptions that are about one post (deleted, private, bad link), not about
+# the server pushing back; they must not slow the whole batch down.
+_POST_ERRORS = {
+    "QueryReturnedNotFoundException",
+    "QueryReturnedForbiddenException",
+    "PrivateProfileNotFollowedException",
+    "LoginRequiredException",
+    "BadResponseException",
+}
+_TRANSIENT_ERRORS = {"ConnectionException", "ConnectionError", "Timeout", "TimeoutError"}
+_THROTTLE_TEXT = ("please wait a few minutes", "too many requests", "rate limit")
+
+
+def classify_error(exc):
+    """Return THROTTLED, FAILED (transient, counts towards the breaker) or
+    None for errors that concern a single request only.
+
+    Works from class names and status codes so callers can pass Instaloader
+    and requests exceptions without this module importing either.
+    """
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    text = str(exc).lower()
+    if names & _POST_ERRORS:
+        return None
+    if status == 429 or "TooManyRequestsException" in names or any(t in text for t in _THROTTLE_TEXT):
+        return THROTTLED
+    if (status is not None and status >= 500) or names & _TRANSIENT_ERRORS:
+        return FAILED
+    return None
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised once repeated failures have tripped the circuit breaker."""
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """Token bucket that finds the highest request rate the server accepts.
+
+    Requests go through ``call()``. Each throttling response (429, "Please
+    wait a few minutes") halves the rate, down to ``min_rate``, and pauses
+    every caller for ``pause`` seconds. The pause doubles while throttling
+    continues. After ``success_window`` clean requests in a row the rate
+    grows by ``increase``, up to ``max_rate`` (additive increase,
+    multiplicative decrease). The rate therefore settles just under the
+    point where the server starts pushing back.
+
+    ``failure_threshold`` throttles or transient errors in a row open the
+    circuit. Everyone then waits out a cooldown, after which one probe
+    request is let through: success closes the circuit, failure reopens it
+    with twice the cooldown. Once the cooldown would exceed ``max_pause``
+    the breaker stays open and ``call()`` raises CircuitOpenError, so the
+    rest of the batch fails fast and can be resumed later.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=None, max_rate=None, increase=None,
+                 decrease=0.5, success_window=10, pause=30.0, failure_threshold=5,
+                 max_pause=900.0, attempts=4, name=None, log=print):
+        super().__init__(rate, capacity)
+        self.max_rate = float(max_rate if max_rate is not None else rate)
+        self.min_rate = float(min_rate if min_rate is not None else self.max_rate / 20)
+        self.increase = float(increase if increase is not None else self.max_rate / 20)
+        self.decrease = decrease
+        self.success_window = success_window
+        self.pause = pause
+        self.failure_threshold = failure_threshold
+        self.max_pause = max_pause
+        self.attempts = attempts
+        self.name = name
+        self.log = log
+        self._successes = 0
+        self._failures = 0
+        self._throttle_streak = 0
+        self._resume_at = 0.0
+        self._cooldown = pause
+        self._circuit = "closed"  # closed -> open -> half-open -> closed | tripped
+        self._opened = 0  # times the circuit has opened
+        self._probe_out = False
+        self.last_throttled = None
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, burst=None, min_per_minute=None, **kwargs):
+        min_rate = min_per_minute / 60.0 if min_per_minute else None
+        return cls(requests_per_minute / 60.0, burst, min_rate=min_rate, **kwargs)
+
+    @property
+    def tripped(self):
+        return self._circuit == "tripped"
+
+    def paused_for(self):
+        """Seconds until requests may be sent again (0 when not paused)."""
+        return max(0.0, self._resume_at - time.monotonic())
+
+    def _wait_turn(self):
+        """Block through pauses and open-circuit cooldowns."""
+        while True:
+            with self._lock:
+                if self._circuit == "tripped":
+                    raise CircuitOpenError("too many failures in a row; stopped sending requests")
+                wait = self._resume_at - time.monotonic()
+                if wait <= 0:
+                    if self._circuit == "open":
+                        self._circuit = "half-open"
+                    if self._circuit != "half-open":
+                        return False
+                    if not self._probe_out:
+                        self._probe_out = True
+                        return True
+                    wait = 0.5  # someone else is probing; check back shortly
+            time.sleep(wait)
+
+    def call(self, fn, *args, **kwargs):
+        """Run ``fn`` under the adaptive rate, retrying throttled and
+        transient failures up to ``attempts`` times."""
+        for attempt in range(1, self.attempts + 1):
+            probe = self._wait_turn()
+            self.acquire()
+            opened = self._opened
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind is None:
+                    if probe:
+                        self._record_success()
+                    raise
+                self._record_failure(kind, _retry_after(e), probe, opened)
+                if attempt >= self.attempts:
+                    raise
+                continue
+            self._record_success()
+            return result
+
+    def _say(self, message):
+        self.log(f"{message} [{self.name}]" if self.name else message)
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._throttle_streak = 0
+            if self._circuit in ("half-open", "open"):
+                self._circuit = "closed"
+                self._probe_out = False
+                self._cooldown = self.pause
+                self._say(f"✅ Requests flowing again at {self.rate * 60:.1f}/min")
+            self._successes += 1
+            if self._successes >= self.success_window and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                self._successes = 0
+
+    def _record_failure(self, kind, retry_after=None, probe=False, opened=None):
+        with self._lock:
+            if not probe and opened is not None and opened != self._opened:
+                # sent before the circuit opened, which already accounted
+                # for it; only the probe's result moves the cooldown
+                return
+            now = time.monotonic()
+            self._successes = 0
+            self._failures += 1
+            if kind == THROTTLED:
+                self.last_throttled = now
+                self._throttle_streak += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._tokens = min(self._tokens, 0.0)
+            if probe or self._failures >= self.failure_threshold:
+                self._probe_out = False
+                if probe:
+                    self._cooldown *= 2
+                if self._cooldown > self.max_pause:
+                    self._circuit = "tripped"
+                    self._say("⛔ Circuit breaker tripped after repeated failures; giving up on the rest for now")
+                    return
+                self._circuit = "open"
+                self._opened += 1
+                self._resume_at = max(self._resume_at, now + self._cooldown)
+                self._say(f"⛔ Circuit open after {self._failures} failures; retrying in {self._cooldown:.0f}s")
+                return
+            if kind == THROTTLED:
+                pause = self.pause * 2 ** (self._throttle_streak - 1)
+                pause = min(self.max_pause, max(pause, retry_after or 0))
+                self._resume_at = max(self._resume_at, now + pause)
+                self._say(f"⏳ Throttled: slowing to {self.rate * 60:.1f} requests/min, pausing {pause:.0f}s")
+
+
+class SessionPool:
+    """Spread requests over several logged-in sessions, each with its own
+    rate limiter, so a batch isn't capped by one account's limit.
+
+    `pick()` returns the (name, client, limiter) to use for the next item:
+    not tripped, the least time left to wait, then least recently throttled,
+    then least used, which degrades to plain round-robin while nothing is
+    being throttled. Once every session's breaker has tripped it still
+    returns one, whose limiter then refuses with CircuitOpenError.
+    """
+
+    def __init__(self, sessions):
+        # sessions: iterable of (name, client, limiter)
+        self.sessions = list(sessions)
+        if not self.sessions:
+            raise ValueError("a session pool needs at least one session")
+        self._uses = [0] * len(self.sessions)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def pick(self):
+        with self._lock:
+            live = [i for i, (_n, _c, limiter) in enumerate(self.sessions)
+                    if not getattr(limiter, "tripped", False)] or range(len(self.sessions))
+
+            def rank(i):
+                limiter = self.sessions[i][2]
+                if not isinstance(limiter, AdaptiveRateLimiter):
+                    return (0.0, float("-inf"), self._uses[i])
+                return (limiter.paused_for(), limiter.last_throttled or float("-inf"), self._uses[i])
+
+            best = min(live, key=rank)
+            self._uses[best] += 1
+            return self.sessions[best]
+
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    value = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    return float(value) if value and str(value).isdigit() else None
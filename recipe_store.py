@@ -0,0 +1,355 @@
+"""The recipe library: every fetched recipe, parsed, in one SQLite file."""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from caption_parser import PARSER_VERSION
+
+
+class Recipe:
+    """One recipe as stored in the library.
+
+    Raw fields (`url`, `title`, `caption`) come from Instagram; `sections`
+    is the `split_sections_strict` output for the caption, kept with the
+    `parser_version` that produced it. `content_hash` fingerprints the raw
+    fields, so changed captions are easy to spot. `thumbnail` is the path
+    of the finished thumbnail kept next to the library.
+
+    The pipeline passes recipes around as plain dicts; `from_dict()` and
+    `as_dict()` convert at the library boundary.
+    """
+
+    __slots__ = ("shortcode", "url", "title", "caption", "thumbnail", "sections",
+                 "parser_version", "content_hash", "fetched_at")
+
+    def __init__(self, shortcode, url, title, caption, thumbnail=None, sections=None,
+                 parser_version=None, content_hash=None, fetched_at=None):
+        self.shortcode = shortcode
+        self.url = url
+        self.title = title
+        self.caption = caption or ""
+        self.thumbnail = thumbnail
+        self.sections = sections
+        self.parser_version = parser_version if sections is not None else None
+        self.content_hash = content_hash or self.hash_content(url, title, self.caption)
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+
+    def __repr__(self):
+        return f"Recipe({self.shortcode!r}, {self.title!r})"
+
+    @staticmethod
+    def hash_content(url, title, caption):
+        h = hashlib.sha256()
+        for part in (url, title, caption):
+            h.update((part or "").encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    @property
+    def parsed(self):
+        """True when `sections` is current for this parser."""
+        return self.sections is not None and self.parser_version == PARSER_VERSION
+
+    @classmethod
+    def from_dict(cls, recipe):
+        sections = recipe.get("sections")
+        return cls(recipe["shortcode"], recipe.get("url"), recipe.get("title"), recipe.get("caption"),
+                   recipe.get("thumbnail"), sections, PARSER_VERSION if sections is not None else None)
+
+    def as_dict(self):
+        recipe = {
+            "title": self.title,
+            "caption": self.caption,
+            "url": self.url,
+            "shortcode": self.shortcode,
+            "thumbnail": self.thumbnail,
+        }
+        if self.parsed:
+            recipe["sections"] = self.sections
+        return recipe
+
+
+_COLUMNS = Recipe.__slots__
+# Servings and macros copied out of `sections` so searches can filter on them
+MACRO_COLUMNS = ("servings", "cal", "protein", "carbs", "fat")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    shortcode TEXT PRIMARY KEY,
+    url TEXT,
+    title TEXT,
+    caption TEXT,
+    thumbnail TEXT,
+    sections TEXT,
+    parser_version INTEGER,
+    content_hash TEXT,
+    fetched_at REAL,
+    servings INTEGER,
+    cal INTEGER,
+    protein INTEGER,
+    carbs INTEGER,
+    fat INTEGER
+)
+"""
+
+# Full-text index over the parsed recipe; its rowid is the recipes rowid.
+_SEARCH_SCHEMA = "CREATE VIRTUAL TABLE recipe_search USING fts5(title, ingredients, instructions)"
+# bm25 column weights: a title hit ranks above an ingredient hit, which
+# ranks above a mention somewhere in the steps
+_SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def _macros(sections):
+    sections = sections or {}
+    macros = sections.get("macros") or {}
+    return (sections.get("servings"),) + tuple(macros.get(k) for k in MACRO_COLUMNS[1:])
+
+
+def _search_text(record):
+    sections = record.sections or {}
+    ingredients = "\n".join(line for lines in (sections.get("ingredients") or {}).values() for line in lines)
+    return record.title or "", ingredients, "\n".join(sections.get("instructions") or [])
+
+
+def _query_terms(query):
+    """(include, exclude) FTS5 prefix terms of a search query. Words with
+    no letters or digits (a lone "-", stray punctuation) are dropped."""
+    include, exclude = [], []
+    for word in query.replace(",", " ").split():
+        target = exclude if word.startswith("-") else include
+        word = word.lstrip("-") if target is exclude else word
+        if not any(ch.isalnum() for ch in word):
+            continue
+        target.append('"{}"*'.format(word.replace('"', '""')))
+    return include, exclude
+
+
+def match_expression(query):
+    """Plain search words to an FTS5 query: every word must match (as a
+    prefix, so "potato" finds "potatoes"), "-word" excludes, and commas
+    are ignored. "chicken, -rice" -> '"chicken"* NOT "rice"*'. None when
+    nothing is left to include (see exclusion_expression)."""
+    include, exclude = _query_terms(query)
+    if not include:
+        return None
+    return " ".join(include) + "".join(f" NOT {w}" for w in exclude)
+
+
+def exclusion_expression(query):
+    """FTS5 query matching anything a query made only of "-word"s rules
+    out ("-rice -beans" -> '"rice"* OR "beans"*'); None otherwise."""
+    include, exclude = _query_terms(query)
+    if include or not exclude:
+        return None
+    return " OR ".join(exclude)
+
+
+class RecipeLibrary:
+    """Persistent store of `Recipe` records in SQLite at `path`.
+
+    Recipes keep the order they were first added in; saving a shortcode
+    again updates it in place. Thumbnails are copied into `images/` beside
+    the database, because the image cache may evict them, and rendering
+    from the library must work without going back to Instagram.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.image_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "images")
+        # images/ only appears once there is a thumbnail to keep
+        os.makedirs(os.path.dirname(self.image_dir), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        migrated = self._migrate()
+        created = self._create_search_index()
+        self.searchable = created is not None
+        if migrated or created:
+            self.reindex()
+
+    def _migrate(self):
+        # libraries written before macro columns existed get them filled in
+        have = {row[1] for row in self._conn.execute("PRAGMA table_info(recipes)")}
+        missing = [c for c in MACRO_COLUMNS if c not in have]
+        with self._conn:
+            for column in missing:
+                self._conn.execute(f"ALTER TABLE recipes ADD COLUMN {column} INTEGER")
+        return bool(missing)
+
+    def _create_search_index(self):
+        """True if the search index was just created (and needs filling),
+        False if it already existed, None if this SQLite has no FTS5."""
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'recipe_search'").fetchone():
+            return False
+        try:
+            with self._conn:
+                self._conn.execute(_SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            return None
+        return True
+
+    def _index(self, rowid, record):
+        self._conn.execute(f"UPDATE recipes SET {', '.join(c + ' = ?' for c in MACRO_COLUMNS)} WHERE rowid = ?",
+                           _macros(record.sections) + (rowid,))
+        if self.searchable:
+            self._conn.execute("DELETE FROM recipe_search WHERE rowid = ?", (rowid,))
+            self._conn.execute("INSERT INTO recipe_search (rowid, title, ingredients, instructions) "
+                               "VALUES (?, ?, ?, ?)", (rowid,) + _search_text(record))
+
+    def reindex(self):
+        """Rebuild macro columns and the search index from stored sections."""
+        rows = self._conn.execute(f"SELECT rowid, {', '.join(_COLUMNS)} FROM recipes").fetchall()
+        with self._conn:
+            if self.searchable:
+                self._conn.execute("DELETE FROM recipe_search")
+            for row in rows:
+                self._index(row[0], self._record(row[1:]))
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+
+    def __contains__(self, code):
+        return self._conn.execute("SELECT 1 FROM recipes WHERE shortcode = ?", (code,)).fetchone() is not None
+
+    def _keep_thumbnail(self, record):
+        src = record.thumbnail
+        if not src:
+            return None
+        dest = os.path.join(self.image_dir, record.shortcode + ".jpg")
+        if isinstance(src, (bytes, bytearray)):
+            data = bytes(src)
+        elif os.path.abspath(src) == dest:
+            return dest
+        else:
+            if os.path.exists(dest) and os.path.getsize(dest) == os.path.getsize(src):
+                return dest
+            with open(src, "rb") as f:
+                data = f.read()
+        os.makedirs(self.image_dir, exist_ok=True)
+        tmp = dest + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, dest)
+        return dest
+
+    def _row(self, record):
+        record.thumbnail = self._keep_thumbnail(record)
+        sections = json.dumps(record.sections, ensure_ascii=False) if record.sections is not None else None
+        return (record.shortcode, record.url, record.title, record.caption, record.thumbnail,
+                sections, record.parser_version, record.content_hash, record.fetched_at)
+
+    def save_many(self, records):
+        """Insert or update `records` in a single transaction; returns how
+        many were written."""
+        records = list(records)
+        rows = [self._row(r) for r in records]
+        updates = ", ".join(f"{c} = excluded.{c}" for c in _COLUMNS[1:])
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO recipes ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))}) "
+                f"ON CONFLICT(shortcode) DO UPDATE SET {updates}",
+                rows,
+            )
+            for record in records:
+                rowid = self._conn.execute("SELECT rowid FROM recipes WHERE shortcode = ?",
+                                           (record.shortcode,)).fetchone()[0]
+                self._index(rowid, record)
+        return len(rows)
+
+    def save(self, record):
+        self.save_many([record])
+
+    @staticmethod
+    def _record(row):
+        values = dict(zip(_COLUMNS, row))
+        if values["sections"] is not None:
+            values["sections"] = json.loads(values["sections"])
+        return Recipe(**values)
+
+    def get(self, code):
+        row = self._conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM recipes WHERE shortcode = ?", (code,)).fetchone()
+        return self._record(row) if row else None
+
+    def load(self, codes=None):
+        """Records for `codes` in that order (unknown ones skipped), or the
+        whole library in the order recipes were added. Streams rows, so
+        large libraries aren't read into memory at once."""
+        select = f"SELECT {', '.join(_COLUMNS)} FROM recipes"
+        if codes is None:
+            for row in self._conn.execute(select + " ORDER BY rowid"):
+                yield self._record(row)
+            return
+        for code in codes:
+            record = self.get(code)
+            if record is not None:
+                yield record
+
+    def __iter__(self):
+        return self.load()
+
+    def macro_rows(self):
+        """(shortcode, title, servings, cal, protein, carbs, fat) for every
+        recipe in library order, None where a value wasn't found."""
+        return self._conn.execute(
+            f"SELECT shortcode, title, {', '.join(MACRO_COLUMNS)} FROM recipes ORDER BY rowid").fetchall()
+
+    def search(self, query=None, limit=None, **bounds):
+        """Recipes matching `query` (see match_expression), best match
+        first, or in library order without a query. A query of only
+        "-word"s keeps library order and drops what those words match.
+
+        `bounds` filter on servings and macros, as `max_<col>` / `min_<col>`
+        for the columns in MACRO_COLUMNS, e.g. ``max_cal=500,
+        min_protein=30``. Recipes where that value wasn't found in the
+        caption never pass a bound on it.
+        """
+        where, params = [], []
+        for name, value in bounds.items():
+            if value is None:
+                continue
+            op, _, column = name.partition("_")
+            if op not in ("min", "max") or column not in MACRO_COLUMNS:
+                raise TypeError(f"unknown search bound {name!r}")
+            where.append(f"r.{column} {'>=' if op == 'min' else '<='} ?")
+            params.append(value)
+        select = ", ".join("r." + c for c in _COLUMNS)
+        expression = match_expression(query) if query else None
+        excluded = exclusion_expression(query) if query else None
+        if (expression or excluded) and not self.searchable:
+            raise SystemExit("This SQLite build has no FTS5, so the library can't be searched.")
+        if excluded:
+            # only exclusions: everything except what they match
+            where.append("r.rowid NOT IN (SELECT rowid FROM recipe_search WHERE recipe_search MATCH ?)")
+            params.append(excluded)
+        if expression:
+            sql = (f"SELECT {select} FROM recipe_search JOIN recipes r ON r.rowid = recipe_search.rowid "
+                   f"WHERE recipe_search MATCH ?{''.join(' AND ' + w for w in where)} "
+                   f"ORDER BY bm25(recipe_search, {', '.join(map(str, _SEARCH_WEIGHTS))})")
+            params.insert(0, expression)
+        else:
+            sql = f"SELECT {select} FROM recipes r{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY r.rowid"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._record(row) for row in self._conn.execute(sql, params)]
+
+
+def import_recipes(library, recipes, batch=200):
+    """Save pipeline recipe dicts into `library` in batches while passing
+    them through unchanged, so a streaming run can persist as it goes."""
+    pending = []
+    for recipe in recipes:
+        if recipe.get("shortcode"):
+            pending.append(Recipe.from_dict(recipe))
+        if len(pending) >= batch:
+            library.save_many(pending)
+            pending = []
+        yield recipe
+    if pending:
+        library.save_many(pending)
@@ -0,0 +1,100 @@
+"""Find posts the logged-in account saved since the last sync."""
+import json
+from contextlib import contextmanager
+
+from instaloader import Profile
+
+# The web GraphQL API only exposes "All posts"; named collections come from
+# the app API, which pages with max_id.
+COLLECTIONS_PATH = "api/v1/collections/list/"
+COLLECTION_POSTS_PATH = "api/v1/feed/collection/{}/posts/"
+COLLECTION_TYPES = json.dumps(["ALL_MEDIA_AUTO_COLLECTION", "MEDIA"])
+
+
+def _paged(context, path, params=None):
+    """Yield pages from an app API endpoint until it has no more."""
+    params = dict(params or {})
+    while True:
+        data = context.get_iphone_json(path, params)
+        yield data
+        if not data.get("more_available") or not data.get("next_max_id"):
+            return
+        params["max_id"] = data["next_max_id"]
+
+
+def collection_id(context, name):
+    for page in _paged(context, COLLECTIONS_PATH, {"collection_types": COLLECTION_TYPES}):
+        for item in page.get("items", []):
+            if (item.get("collection_name") or "").casefold() == name.casefold():
+                return item["collection_id"]
+    raise SystemExit(f"No saved collection named {name!r}.")
+
+
+@contextmanager
+def limited_requests(context, limiter):
+    """Send every JSON request `context` makes (GraphQL pages, app API
+    pages, profile lookups all go through get_json) through `limiter`'s
+    call(), so the saved-post walk shares the fetch budget and throttling
+    here slows the fetches down too.
+
+    Instaloader retries by calling get_json again with `_attempt` set;
+    those calls pass straight through, so each page gets one limiter
+    retry loop rather than one per nesting level."""
+    if limiter is None:
+        yield
+        return
+    get_json = context.get_json
+
+    def limited_get_json(*args, **kwargs):
+        if "_attempt" in kwargs:
+            return get_json(*args, **kwargs)
+        return limiter.call(get_json, *args, **kwargs)
+
+    context.get_json = limited_get_json
+    try:
+        yield
+    finally:
+        del context.get_json
+
+
+def require_login(loader):
+    if not loader.context.is_logged_in:
+        raise SystemExit("Syncing saved posts needs a login. Run instaloader_login.py first.")
+
+
+def iter_saved_shortcodes(loader, collection=None):
+    """Lazily yield shortcodes of the account's saved posts, most recently
+    saved first. Pages are requested only as the caller keeps iterating."""
+    require_login(loader)
+    context = loader.context
+    if not collection:
+        profile = Profile.from_username(context, context.username)
+        for post in profile.get_saved_posts():
+            yield post.shortcode
+        return
+    path = COLLECTION_POSTS_PATH.format(collection_id(context, collection))
+    for page in _paged(context, path):
+        for item in page.get("items", []):
+            media = item.get("media") or item
+            if media.get("code"):
+                yield media["code"]
+
+
+def new_saved_shortcodes(loader, mark, collection=None, limit=None, limiter=None):
+    """Shortcodes saved since `mark` (a SyncMark), newest first.
+
+    Stops at the first already-synced post, so a daily sync costs a page
+    or two of requests. `limit` caps the walk, e.g. for a first sync of a
+    large collection. With `limiter`, every request goes through it.
+    """
+    new = []
+    if limit is not None and limit <= 0:
+        return new
+    with limited_requests(loader.context, limiter):
+        for code in iter_saved_shortcodes(loader, collection):
+            if mark.seen(code):
+                break
+            new.append(code)
+            if limit and len(new) >= limit:
+                break
+    return new
@@ -0,0 +1,160 @@
+"""Per-stage timing spans with JSON and Prometheus textfile reports."""
+import json
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Histogram bucket upper bounds in seconds (the Prometheus `le` labels).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _percentile(sorted_values, pct):
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class StageTimer:
+    """Collects how long each pipeline stage took, per recipe.
+
+    Wrap work in ``with timer.span("stage", recipe_id):``, or ``record()``
+    a duration measured elsewhere (e.g. in a worker process). Spans may
+    nest; each one is reported on its own, so an outer stage includes the
+    time of the stages inside it. Samples are plain tuples, so a worker
+    process can send back ``samples_since(mark)`` for the parent to
+    ``extend()`` its own timer with.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._samples = []  # (stage, recipe, seconds, ok)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, recipe=None):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(stage, time.perf_counter() - t0, recipe, ok)
+
+    def record(self, stage, seconds, recipe=None, ok=True):
+        with self._lock:
+            self._samples.append((stage, recipe, seconds, ok))
+
+    def mark(self):
+        return len(self._samples)
+
+    def samples_since(self, mark):
+        with self._lock:
+            return self._samples[mark:]
+
+    def extend(self, samples):
+        with self._lock:
+            self._samples.extend(tuple(s) for s in samples)
+
+    def stages(self):
+        """{stage: {count, errors, total_s, mean_s, p50_s, p95_s, max_s}}
+        in the order stages were first seen."""
+        durations, errors = {}, {}
+        with self._lock:
+            samples = list(self._samples)
+        for stage, _recipe, seconds, ok in samples:
+            durations.setdefault(stage, []).append(seconds)
+            errors[stage] = errors.get(stage, 0) + (not ok)
+        out = {}
+        for stage, values in durations.items():
+            values.sort()
+            out[stage] = {
+                "count": len(values),
+                "errors": errors[stage],
+                "total_s": sum(values),
+                "mean_s": statistics.fmean(values),
+                "p50_s": _percentile(values, 50),
+                "p95_s": _percentile(values, 95),
+                "max_s": values[-1],
+            }
+        return out
+
+    def recipes(self):
+        """{recipe: {stage: seconds}}, summing repeated spans of a stage."""
+        out = {}
+        with self._lock:
+            samples = list(self._samples)
+        for stage, recipe, seconds, _ok in samples:
+            if recipe is not None:
+                per = out.setdefault(recipe, {})
+                per[stage] = per.get(stage, 0.0) + seconds
+        return out
+
+    def wall_seconds(self):
+        return time.perf_counter() - self._started
+
+    def summary(self):
+        return ", ".join(f"{stage} {s['total_s']:.2f}s/{s['count']}" for stage, s in self.stages().items())
+
+    def report(self):
+        return {
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            "wall_s": self.wall_seconds(),
+            "stages": self.stages(),
+            "recipes": self.recipes(),
+        }
+
+    def write_json(self, path):
+        _atomic_write(path, json.dumps(self.report(), indent=2) + "\n")
+
+    def prometheus_text(self, prefix="cookbook"):
+        """Prometheus text exposition: a duration histogram and an error
+        counter per stage, plus the run's wall time and finish timestamp."""
+        lines = [
+            f"# HELP {prefix}_stage_duration_seconds Time spent in each pipeline stage, per recipe.",
+            f"# TYPE {prefix}_stage_duration_seconds histogram",
+        ]
+        per_stage = {}
+        with self._lock:
+            samples = list(self._samples)
+        for stage, _recipe, seconds, ok in samples:
+            per_stage.setdefault(stage, []).append((seconds, ok))
+        for stage, values in per_stage.items():
+            label = f'stage="{stage}"'
+            for bound in self.buckets:
+                n = sum(1 for seconds, _ok in values if seconds <= bound)
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{{label},le="{bound:g}"}} {n}')
+            lines.append(f'{prefix}_stage_duration_seconds_bucket{{{label},le="+Inf"}} {len(values)}')
+            lines.append(f"{prefix}_stage_duration_seconds_sum{{{label}}} {sum(s for s, _ok in values):.6f}")
+            lines.append(f"{prefix}_stage_duration_seconds_count{{{label}}} {len(values)}")
+        lines += [
+            f"# HELP {prefix}_stage_errors_total Stage spans that ended in an exception.",
+            f"# TYPE {prefix}_stage_errors_total counter",
+        ]
+        for stage, values in per_stage.items():
+            lines.append(f'{prefix}_stage_errors_total{{stage="{stage}"}} {sum(1 for _s, ok in values if not ok)}')
+        lines += [
+            f"# HELP {prefix}_run_duration_seconds Wall time of the last run.",
+            f"# TYPE {prefix}_run_duration_seconds gauge",
+            f"{prefix}_run_duration_seconds {self.wall_seconds():.6f}",
+            f"# HELP {prefix}_run_finished_timestamp_seconds When the last run finished.",
+            f"# TYPE {prefix}_run_finished_timestamp_seconds gauge",
+            f"{prefix}_run_finished_timestamp_seconds {time.time():.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix="cookbook"):
+        # node_exporter's textfile collector may read at any moment, so the
+        # file is swapped in whole
+        _atomic_write(path, self.prometheus_text(prefix))
+
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)